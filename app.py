@@ -1,18 +1,45 @@
-from flask import Flask, request, render_template, redirect
+from flask import (
+    Flask,
+    Response,
+    g,
+    request,
+    render_template,
+    redirect,
+    stream_with_context,
+)
 from flask_httpauth import HTTPBasicAuth
+from kubernetes.client.rest import ApiException
 from werkzeug.security import check_password_hash
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from functools import wraps
+from urllib.parse import urlencode
+import contextvars
+import io
+import itertools
+import json
+import os
+import tarfile
+import tempfile
+import time
 import yaml
 
+import archive
+import clusters
 import config
+import usage
 from kron import (
+    select_clients,
+    reset_clients,
     get_cronjobs,
+    iter_cronjobs,
     get_jobs,
     get_jobs_and_pods,
     get_cronjob,
     get_pods,
     get_pod_logs,
+    stream_pod_logs,
+    diff_objects,
     pod_is_owned_by,
     toggle_cronjob_suspend,
     trigger_cronjob,
@@ -21,9 +48,104 @@ from kron import (
     delete_job,
 )
 
+# Use the much faster libyaml bindings when PyYAML was built with them
+try:
+    from yaml import CSafeDumper as YamlDumper, CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeDumper as YamlDumper, SafeLoader as YamlLoader
+
 app = Flask(__name__, static_url_path="", static_folder="static")
 auth = HTTPBasicAuth()
 
+# API clients, plus summaries of CronJobs and Jobs kept fresh by background watches,
+# for each configured cluster
+CLUSTERS = clusters.load_clusters()
+
+for cluster in CLUSTERS.values():
+    # Optionally archive the logs of finished jobs, which requires the cache
+    if config.LOG_ARCHIVE_DIR and not config.DISABLE_CACHE:
+        archive_dir = config.LOG_ARCHIVE_DIR
+        if config.CLUSTERS:
+            archive_dir = os.path.join(archive_dir, cluster.name)
+        cluster.archive = archive.LogArchive(
+            archive_dir,
+            cluster.clients["v1"],
+            config.LOG_ARCHIVE_RETENTION_DAYS,
+            cluster.throttle,
+        )
+        cluster.state.subscribe(cluster.archive.on_change)
+
+    # Sample the resource usage of running jobs, which also requires the cache. One
+    # worker collects samples and shares them with the others, which have the same
+    # parent (the gunicorn master).
+    if config.USAGE_INTERVAL and not config.DISABLE_CACHE:
+        cluster.usage = usage.UsageCollector(
+            cluster.state,
+            cluster.clients["custom"],
+            config.USAGE_INTERVAL,
+            config.USAGE_HISTORY,
+            cluster.throttle,
+            os.path.join(
+                tempfile.gettempdir(),
+                f"kronic-{os.getppid()}-usage-{cluster.name}.json",
+            ),
+        )
+
+    if not config.TEST and not config.DISABLE_CACHE:
+        cluster.start()
+
+
+@app.before_request
+def select_cluster():
+    """Route kron calls to the cluster named by `?cluster=`
+
+    Pages put the cluster into every link, form and API call they generate, so an
+    action always targets the cluster it was shown for. Bare URLs fall back to the
+    last selected cluster, then the first configured one.
+    """
+    name = request.args.get("cluster")
+    if name is not None and name not in CLUSTERS:
+        return {
+            "error": 404,
+            "exception": {
+                "status": 404,
+                "reason": "Not Found",
+                "message": f"Unknown cluster {name}, see KRONIC_CLUSTERS",
+            },
+        }, 404
+    name = name or request.cookies.get("kronic-cluster")
+    g.cluster = CLUSTERS.get(name) or next(iter(CLUSTERS.values()))
+    g.clients_token = select_clients(g.cluster.clients)
+
+
+@app.after_request
+def remember_cluster(response):
+    if request.args.get("cluster") in CLUSTERS:
+        response.set_cookie("kronic-cluster", request.args["cluster"], samesite="Lax")
+    return response
+
+
+@app.teardown_request
+def reset_cluster(exception):
+    token = g.pop("clients_token", None)
+    if token:
+        reset_clients(token)
+
+
+def _cluster_arg() -> str:
+    """Return the query string selecting the current cluster, when there are several"""
+    if not config.CLUSTERS:
+        return ""
+    return "?" + urlencode({"cluster": g.cluster.name})
+
+
+@app.context_processor
+def inject_clusters():
+    return {
+        "cluster_names": list(CLUSTERS) if config.CLUSTERS else [],
+        "cluster_arg": _cluster_arg(),
+    }
+
 
 @auth.verify_password
 def verify_password(username, password):
@@ -69,6 +191,31 @@ def _strip_immutable_fields(spec):
     return spec
 
 
+def _strip_server_fields(spec):
+    """Strip fields set by the API server, leaving only what an edit can change"""
+    spec = _strip_immutable_fields(spec)
+    metadata = spec.get("metadata", {})
+    for field in ("generation", "creationTimestamp", "managedFields"):
+        metadata.pop(field, None)
+    return spec
+
+
+def _validate_cronjob(spec, namespace):
+    """Return a description of what's wrong with an edited CronJob, or None"""
+    if not isinstance(spec, dict):
+        return "The YAML must describe a single CronJob object"
+    if spec.get("kind", "CronJob") != "CronJob":
+        return f"Expected kind CronJob, not {spec['kind']}"
+    metadata = spec.get("metadata")
+    if not isinstance(metadata, dict) or not metadata.get("name"):
+        return "metadata.name is required"
+    if metadata.get("namespace", namespace) != namespace:
+        return f"metadata.namespace must be {namespace}, CronJobs can't be moved here"
+    if not isinstance(spec.get("spec"), dict):
+        return "spec is required"
+    return None
+
+
 @app.route("/healthz")
 def healthz():
     return {"status": "ok"}
@@ -84,13 +231,67 @@ def index():
             code=302,
         )
 
+    if config.CLUSTERS:
+        summaries, errors = clusters.fan_out(_namespace_summary, CLUSTERS.values())
+    else:
+        summaries, errors = {g.cluster.name: _namespace_summary(g.cluster)}, {}
+
+    return render_template("index.html", clusters=summaries, errors=errors)
+
+
+def _namespace_summary(cluster):
+    if cluster.state.ready:
+        return cluster.state.namespace_summary()
+
     cronjobs = get_cronjobs()
     namespaces = {}
     # Count cronjobs per namespace
     for cronjob in cronjobs:
-        namespaces[cronjob["namespace"]] = namespaces.get(cronjob["namespace"], 0) + 1
+        counts = namespaces.setdefault(cronjob["namespace"], {"cronjobs": 0})
+        counts["cronjobs"] += 1
+    return namespaces
+
+
+def _failing_jobs():
+    """Return the failing jobs of every cluster, newest first, and an error for each
+    cluster whose job cache is still syncing, so its jobs may be missing"""
+    jobs = [
+        {"cluster": cluster.name, **job}
+        for cluster in CLUSTERS.values()
+        for job in cluster.state.failing_jobs()
+    ]
+    errors = {
+        cluster.name: "The job cache has not finished syncing"
+        for cluster in CLUSTERS.values()
+        if not cluster.state.ready
+    }
+    return sorted(jobs, key=lambda job: job["startTime"], reverse=True), errors
+
+
+@app.route("/failing")
+@auth.login_required
+def view_failing():
+    jobs, errors = _failing_jobs()
+    return render_template(
+        "failing.html",
+        jobs=jobs,
+        errors=errors,
+        disabled=config.DISABLE_CACHE,
+    )
 
-    return render_template("index.html", namespaces=namespaces)
+
+@app.route("/search")
+@auth.login_required
+def view_search():
+    query = request.args.get("q", "")
+    results = g.cluster.search.search(query) if query else []
+    return render_template(
+        "search.html",
+        query=query,
+        results=results,
+        ready=g.cluster.state.ready,
+        disabled=config.DISABLE_CACHE,
+    )
 
 
 @app.route("/namespaces/<namespace>")
@@ -105,7 +306,9 @@ def view_namespace(namespace):
         cronjob_detail = get_cronjob(namespace, cronjob["name"])
         jobs = get_jobs(namespace=namespace, cronjob_name=cronjob["name"])
         for job in jobs:
-            job["pods"] = [pod for pod in all_pods if pod_is_owned_by(pod, job["metadata"]["name"])]
+            job["pods"] = [
+                pod for pod in all_pods if pod_is_owned_by(pod, job["metadata"]["name"])
+            ]
         cronjob_detail["jobs"] = jobs
         cronjobs_with_details.append(cronjob_detail)
 
@@ -119,15 +322,9 @@ def view_namespace(namespace):
 @auth.login_required
 def view_cronjob(namespace, cronjob_name):
     if request.method == "POST":
-        edited_cronjob = yaml.safe_load(request.form["yaml"])
-        cronjob = update_cronjob(namespace, edited_cronjob)
-        if cronjob["metadata"]["name"] != cronjob_name:
-            return redirect(
-                f"/namespaces/{namespace}/cronjobs/{cronjob['metadata']['name']}",
-                code=302,
-            )
-    else:
-        cronjob = get_cronjob(namespace, cronjob_name)
+        return _submit_cronjob(namespace, cronjob_name)
+
+    cronjob = get_cronjob(namespace, cronjob_name)
 
     if cronjob:
         cronjob = _strip_immutable_fields(cronjob)
@@ -162,7 +359,65 @@ def view_cronjob(namespace, cronjob_name):
             },
         }
 
-    cronjob_yaml = yaml.dump(cronjob)
+    cronjob_yaml = yaml.dump(cronjob, Dumper=YamlDumper)
+    return render_template("cronjob.html", cronjob=cronjob, yaml=cronjob_yaml)
+
+
+def _submit_cronjob(namespace, cronjob_name):
+    """Validate and preview (`action=preview`) or apply an edited CronJob"""
+    submitted_yaml = request.form["yaml"]
+    form_cronjob = {"metadata": {"name": cronjob_name, "namespace": namespace}}
+
+    def render_error(error):
+        return render_template(
+            "cronjob.html", cronjob=form_cronjob, yaml=submitted_yaml, error=error
+        )
+
+    try:
+        edited_cronjob = yaml.load(submitted_yaml, Loader=YamlLoader)
+    except yaml.YAMLError as e:
+        return render_error(f"Invalid YAML: {e}")
+    error = _validate_cronjob(edited_cronjob, namespace)
+    if error:
+        return render_error(error)
+
+    # A dry run validates and defaults the CronJob on the server without saving it
+    preview = request.form.get("action") == "preview"
+    conflict = None
+    if preview:
+        # Previewed without forcing, so fields managed by others (ie: Helm or Argo)
+        # show up as conflicts. Applying takes them over, so preview that too.
+        cronjob = update_cronjob(namespace, edited_cronjob, dry_run=True, force=False)
+        if cronjob.get("exception", {}).get("status") == 409:
+            conflict = cronjob["exception"]["message"]
+            cronjob = update_cronjob(namespace, edited_cronjob, dry_run=True)
+    else:
+        cronjob = update_cronjob(namespace, edited_cronjob)
+    if "error" in cronjob:
+        return render_error(cronjob["exception"]["message"])
+
+    if preview:
+        live_cronjob = get_cronjob(namespace, cronjob["metadata"]["name"]) or {}
+        changes = diff_objects(
+            _strip_server_fields(live_cronjob), _strip_server_fields(cronjob)
+        )
+        return render_template(
+            "cronjob.html",
+            cronjob=form_cronjob,
+            yaml=submitted_yaml,
+            changes=changes,
+            is_new=not live_cronjob,
+            conflict=conflict,
+        )
+
+    if cronjob["metadata"]["name"] != cronjob_name:
+        return redirect(
+            f"/namespaces/{namespace}/cronjobs/{cronjob['metadata']['name']}"
+            + _cluster_arg(),
+            code=302,
+        )
+    cronjob = _strip_immutable_fields(cronjob)
+    cronjob_yaml = yaml.dump(cronjob, Dumper=YamlDumper)
     return render_template("cronjob.html", cronjob=cronjob, yaml=cronjob_yaml)
 
 
@@ -179,6 +434,85 @@ def api_index():
     return jobs
 
 
+_cache_disabled = {
+    "error": 404,
+    "exception": {
+        "status": 404,
+        "reason": "Not Found",
+        "message": "The job cache is disabled, see KRONIC_DISABLE_CACHE",
+    },
+}
+
+
+@app.route("/api/failing")
+@auth.login_required
+def api_failing():
+    """Return the latest failed job of every failing CronJob, from the job cache
+
+    Clusters whose cache is still syncing are listed under `errors` and are false in
+    `ready`, since their failing jobs may be missing from `jobs`.
+    """
+    if config.DISABLE_CACHE:
+        return _cache_disabled, 404
+    jobs, errors = _failing_jobs()
+    if len(errors) == len(CLUSTERS):
+        return {
+            "error": 503,
+            "exception": {
+                "status": 503,
+                "reason": "Service Unavailable",
+                "message": "The job cache has not finished syncing",
+            },
+        }, 503
+    return {
+        "jobs": jobs,
+        "ready": {name: name not in errors for name in CLUSTERS},
+        "errors": errors,
+    }
+
+
+@app.route("/api/search")
+@auth.login_required
+def api_search():
+    """Search CronJob names, labels, images, commands, env vars, secrets and schedules"""
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", 100, type=int)
+    if config.DISABLE_CACHE:
+        return _cache_disabled, 404
+    return g.cluster.search.search(query, limit=limit)
+
+
+@app.route("/api/clusters")
+@auth.login_required
+def api_clusters():
+    """Return each cluster with its per-namespace counts, from the caches"""
+    return [
+        {
+            "name": cluster.name,
+            "ready": cluster.state.ready,
+            "namespaces": cluster.state.namespace_summary(),
+        }
+        for cluster in CLUSTERS.values()
+    ]
+
+
+@app.route("/api/clusters/cronjobs")
+@auth.login_required
+def api_clusters_cronjobs():
+    """List CronJobs in all clusters concurrently. Clusters which fail or don't
+    answer within KRONIC_CLUSTER_TIMEOUT are listed under `errors`."""
+    results, errors = clusters.fan_out(
+        lambda cluster: get_cronjobs(), CLUSTERS.values()
+    )
+    cronjobs = []
+    for name, cluster_cronjobs in results.items():
+        if "error" in cluster_cronjobs:
+            errors[name] = cluster_cronjobs["exception"]["message"]
+            continue
+        cronjobs.extend({"cluster": name, **cronjob} for cronjob in cluster_cronjobs)
+    return {"cronjobs": cronjobs, "errors": errors}
+
+
 @app.route("/api/namespaces/<namespace>/cronjobs")
 @app.route("/api/namespaces/<namespace>")
 @namespace_filter
@@ -196,6 +530,100 @@ def api_get_cronjob(namespace, cronjob_name):
     return cronjob
 
 
+class _TarStream(io.RawIOBase):
+    """A write-only file which buffers what a streaming tarfile writes, until drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _export_error(e: ApiException, exported: int) -> str:
+    return f"Export incomplete after {exported} CronJobs: {e.status} {e.reason}\n"
+
+
+def _export_yaml(cronjobs):
+    exported = 0
+    try:
+        for cronjob in cronjobs:
+            yield "---\n" + yaml.dump(_strip_server_fields(cronjob), Dumper=YamlDumper)
+            exported += 1
+    except ApiException as e:
+        # The response has already started, so mark the file itself as incomplete
+        yield "--- # ERROR: " + _export_error(e, exported)
+
+
+def _export_tar(namespace, cronjobs):
+    stream = _TarStream()
+    exported = 0
+
+    def add(name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        tar.addfile(info, io.BytesIO(data))
+
+    with tarfile.open(fileobj=stream, mode="w|") as tar:
+        try:
+            for cronjob in cronjobs:
+                cronjob = _strip_server_fields(cronjob)
+                data = yaml.dump(cronjob, Dumper=YamlDumper).encode()
+                add(f"{namespace}/{cronjob['metadata']['name']}.yaml", data)
+                exported += 1
+                yield stream.drain()
+        except ApiException as e:
+            # The response has already started, so mark the archive itself as incomplete
+            add(f"{namespace}/ERROR", _export_error(e, exported).encode())
+    yield stream.drain()
+
+
+@app.route("/api/namespaces/<namespace>/export")
+@namespace_filter
+@auth.login_required
+def api_export_cronjobs(namespace):
+    """Stream every CronJob in <namespace> as a multi-document YAML file, or as a
+    tar of one YAML file per CronJob with `?format=tar`
+
+    An error listing the first page is returned as an error response. As later
+    pages are listed after the response has started, an error listing them ends
+    the YAML with an `# ERROR:` comment, or the tar with an `ERROR` file.
+    """
+    cronjobs = iter_cronjobs(namespace)
+    try:
+        first = next(cronjobs, None)
+    except ApiException as e:
+        return {
+            "error": e.status,
+            "exception": {"status": e.status, "reason": e.reason, "message": str(e)},
+        }, e.status
+    if first is not None:
+        cronjobs = itertools.chain([first], cronjobs)
+
+    if request.args.get("format") == "tar":
+        body = _export_tar(namespace, cronjobs)
+        mimetype, extension = "application/x-tar", "tar"
+    else:
+        body, mimetype, extension = _export_yaml(cronjobs), "application/yaml", "yaml"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={namespace}-cronjobs.{extension}"
+        },
+    )
+
+
 @app.route(
     "/api/namespaces/<namespace>/cronjobs/<cronjob_name>/clone", methods=["POST"]
 )
@@ -212,6 +640,102 @@ def api_clone_cronjob(namespace, cronjob_name):
     return cronjob
 
 
+def _read_documents(stream, content_type):
+    """Parse objects one at a time from a multi-document YAML or an NDJSON stream"""
+    if "ndjson" in content_type or "jsonl" in content_type:
+        documents = (json.loads(line) for line in stream if line.strip())
+    else:
+        documents = yaml.load_all(stream, Loader=YamlLoader)
+
+    for document in documents:
+        is_dict = isinstance(document, dict)
+        if is_dict and document.get("kind") in ("List", "CronJobList"):
+            yield from document.get("items", [])
+        elif document is not None:
+            yield document
+
+
+def _import_cronjob(namespace, index, document, dry_run):
+    result = {"index": index, "name": None}
+    if isinstance(document, dict) and isinstance(document.get("metadata"), dict):
+        result["name"] = document["metadata"].get("name")
+        # Import into the target namespace, ie: when migrating an export elsewhere
+        document["metadata"]["namespace"] = namespace
+    error = _validate_cronjob(document, namespace)
+    if not error:
+        try:
+            cronjob = update_cronjob(
+                namespace, _strip_server_fields(document), dry_run, bulk=True
+            )
+        except Exception as e:
+            # Report it like any other failure, rather than ending the stream early
+            app.logger.exception(f"importing {namespace}/{result['name']}")
+            cronjob = {"error": 500, "exception": {"message": str(e)}}
+        if "error" in cronjob:
+            error = cronjob["exception"]["message"]
+    if error:
+        return {**result, "status": "failed", "message": error}
+    return {**result, "status": "validated" if dry_run else "applied"}
+
+
+def _import_cronjobs(namespace, documents, dry_run):
+    """Apply CronJobs with bounded parallelism, yielding an NDJSON status line for each"""
+    counts = {"validated" if dry_run else "applied": 0, "failed": 0}
+
+    def report(futures):
+        for future in futures:
+            result = future.result()
+            counts[result["status"]] += 1
+            yield json.dumps(result) + "\n"
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=config.IMPORT_CONCURRENCY) as executor:
+        try:
+            for index, document in enumerate(documents):
+                if len(pending) >= config.IMPORT_CONCURRENCY * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from report(done)
+                # Run with this request's context, so the selected cluster is used
+                pending.add(
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        _import_cronjob,
+                        namespace,
+                        index,
+                        document,
+                        dry_run,
+                    )
+                )
+        except (yaml.YAMLError, ValueError) as e:
+            counts["failed"] += 1
+            error = {"status": "failed", "message": f"Invalid input: {e}"}
+            yield json.dumps(error) + "\n"
+
+        done, _ = wait(pending)
+        yield from report(done)
+
+    yield json.dumps({"summary": {**counts, "dryRun": dry_run}}) + "\n"
+
+
+@app.route("/api/namespaces/<namespace>/import", methods=["POST"])
+@namespace_filter
+@auth.login_required
+def api_import_cronjobs(namespace):
+    """Create or update CronJobs from a multi-document YAML or NDJSON upload
+
+    The upload is parsed and applied as it is read, KRONIC_IMPORT_CONCURRENCY at a
+    time. A status line is streamed back for each CronJob, followed by a summary.
+    CronJobs are imported into <namespace>, whatever their `metadata.namespace`.
+    With `?dryRun=true`, CronJobs are only validated by the API server.
+    """
+    dry_run = request.args.get("dryRun", "").lower() in ("true", "all", "1")
+    documents = _read_documents(request.stream, request.content_type or "")
+    return Response(
+        stream_with_context(_import_cronjobs(namespace, documents, dry_run)),
+        mimetype="application/x-ndjson",
+    )
+
+
 @app.route("/api/namespaces/<namespace>/cronjobs/create", methods=["POST"])
 @namespace_filter
 @auth.login_required
@@ -284,9 +808,102 @@ def api_get_pods(namespace):
 @auth.login_required
 def api_get_pod_logs(namespace, pod_name):
     logs = get_pod_logs(namespace, pod_name)
+    # Fall back to archived logs once the pod is gone
+    log_archive = g.cluster.archive
+    if log_archive and (not logs or logs.startswith("Kronic> Error")):
+        if log_archive.find(namespace, pod=pod_name):
+            return Response(
+                stream_with_context(log_archive.read(namespace, pod_name)),
+                mimetype="text/plain",
+            )
     return logs
 
 
+@app.route("/api/namespaces/<namespace>/pods/<pod_name>/logs/follow")
+@namespace_filter
+@auth.login_required
+def api_follow_pod_logs(namespace, pod_name):
+    """Stream the logs of <pod_name> as they are written, until the pod exits"""
+    return Response(
+        stream_with_context(
+            stream_pod_logs(
+                namespace, pod_name, request.args.get("tailLines", 1000, type=int)
+            )
+        ),
+        mimetype="text/plain",
+        # Keep reverse proxies from buffering the stream
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
+
+
+_archive_denied = {
+    "error": 404,
+    "exception": {
+        "status": 404,
+        "reason": "Not Found",
+        "message": "Log archiving is disabled, see KRONIC_LOG_ARCHIVE_DIR",
+    },
+}
+
+
+@app.route("/api/namespaces/<namespace>/cronjobs/<cronjob_name>/archive")
+@namespace_filter
+@auth.login_required
+def api_get_archived_runs(namespace, cronjob_name):
+    """List the archived pod logs of <cronjob_name>, newest first"""
+    log_archive = g.cluster.archive
+    if not log_archive:
+        return _archive_denied, 404
+    return [
+        {key: value for key, value in entry.items() if key != "chunks"}
+        for entry in log_archive.find(namespace, cronjob=cronjob_name)
+    ]
+
+
+@app.route("/api/namespaces/<namespace>/cronjobs/<cronjob_name>/usage")
+@namespace_filter
+@auth.login_required
+def api_get_cronjob_usage(namespace, cronjob_name):
+    """List the peak and average CPU and memory usage of <cronjob_name>'s recent runs"""
+    collector = g.cluster.usage
+    if not collector:
+        return {
+            "error": 404,
+            "exception": {
+                "status": 404,
+                "reason": "Not Found",
+                "message": "Usage collection is disabled, see KRONIC_USAGE_INTERVAL",
+            },
+        }, 404
+    return collector.usage(namespace, cronjob_name)
+
+
+@app.route("/api/namespaces/<namespace>/logs/search")
+@namespace_filter
+@auth.login_required
+def api_search_logs(namespace):
+    """Stream archived log lines containing `q`, optionally filtered by
+    `cronjob`, `job`, `pod` and a `since`/`until` range in epoch seconds"""
+    log_archive = g.cluster.archive
+    if not log_archive:
+        return _archive_denied, 404
+    query = request.args.get("q", "")
+    filters = {
+        "cronjob": request.args.get("cronjob"),
+        "job": request.args.get("job"),
+        "pod": request.args.get("pod"),
+        "since": request.args.get("since", type=float),
+        "until": request.args.get("until", type=float),
+    }
+    lines = log_archive.search(
+        query,
+        namespace,
+        max_matches=request.args.get("limit", 1000, type=int),
+        **filters,
+    )
+    return Response(stream_with_context(lines), mimetype="text/plain")
+
+
 @app.route("/api/namespaces/<namespace>/jobs/<job_name>/delete", methods=["POST"])
 @namespace_filter
 @auth.login_required
@@ -0,0 +1,412 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from kubernetes.client.rest import ApiException
+from typing import Callable, Iterator, List, Set, Tuple
+
+from cache import owner_cronjob, run_blocking, unthrottled
+
+log = logging.getLogger("app.archive")
+
+# Uncompressed bytes of log lines per chunk. Searches skip or decompress whole chunks.
+CHUNK_SIZE = 1024 * 1024
+# Bloom filter bits per distinct trigram in a chunk, and hashes per trigram (~1% false positives)
+BLOOM_BITS_PER_TRIGRAM = 10
+BLOOM_HASHES = 7
+# Seconds between retention sweeps when no jobs finish
+PRUNE_INTERVAL = 3600
+
+
+def _trigrams(data: bytes) -> Set[bytes]:
+    data = data.lower()
+    return {data[i : i + 3] for i in range(len(data) - 2)}
+
+
+def _bloom_positions(trigram: bytes, size: int) -> Iterator[int]:
+    """Yield the bit positions of a trigram in a bloom filter of `size` bits (double hashing)"""
+    digest = hashlib.blake2b(trigram, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    for i in range(BLOOM_HASHES):
+        yield (h1 + i * h2) % size
+
+
+def build_bloom(trigrams: Set[bytes]) -> bytes:
+    """Build a bloom filter over a set of trigrams"""
+    size = max(len(trigrams) * BLOOM_BITS_PER_TRIGRAM, 64)
+    bits = bytearray((size + 7) // 8)
+    size = len(bits) * 8
+    for trigram in trigrams:
+        for position in _bloom_positions(trigram, size):
+            bits[position >> 3] |= 1 << (position & 7)
+    return bytes(bits)
+
+
+def bloom_may_contain(bits: bytes, query: bytes) -> bool:
+    """Return False if `query` definitely does not occur in the chunk of a bloom filter
+
+    Queries shorter than a trigram can't be ruled out and always return True.
+    """
+    size = len(bits) * 8
+    for trigram in _trigrams(query):
+        for position in _bloom_positions(trigram, size):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+    return True
+
+
+def _encode_chunk(data: bytes) -> Tuple[bytes, bytes]:
+    """Return a chunk's gzipped data and bloom filter, which takes ~0.3s per MiB"""
+    return gzip.compress(data), build_bloom(_trigrams(data))
+
+
+def job_finished(job: object) -> bool:
+    """Return True once a Job has a `Complete` or `Failed` condition"""
+    for condition in (job.status and job.status.conditions) or []:
+        if condition.type in ("Complete", "Failed") and condition.status == "True":
+            return True
+    return False
+
+
+class LogArchive:
+    """Archive the logs of finished jobs' pods to compressed, chunked files on disk
+
+    Logs are stored as `<root>/<namespace>/<job>/<pod>/<container>/<n>.log.gz`, with
+    a bloom filter of the trigrams of each chunk next to it in `<n>.bloom`.
+    `<root>/index.jsonl` has one line per archived container, which records its
+    CronJob, Job, pod and time range, so searches only open the chunks of matching
+    runs whose bloom filters allow a match.
+
+    Several processes (ie: gunicorn workers) may share one archive directory: a job is
+    claimed by creating its directory, and the index is only ever appended to.
+
+    Args:
+        root (str): The archive directory
+        core_api (CoreV1Api): The client used to list pods and read their logs
+        retention_days (int): Archived runs older than this are deleted
+        throttle (function, optional): Called before each pod list and log read, to
+            wait for the rate limit, see `kron.throttle`
+    """
+
+    def __init__(
+        self,
+        root: str,
+        core_api: object,
+        retention_days: int = 7,
+        throttle: Callable = None,
+    ):
+        self.root = root
+        self.core = core_api
+        self.throttle = throttle or unthrottled
+        self.retention = retention_days * 86400
+        self.index_path = os.path.join(root, "index.jsonl")
+        # Held shared while appending to the index, and exclusively while rewriting it
+        self.lock_path = os.path.join(root, "index.lock")
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._entries: List[dict] = []
+        self._index_offset = 0
+        self._index_inode = None
+        os.makedirs(root, exist_ok=True)
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name="log-archive")
+        thread.daemon = True
+        thread.start()
+
+    def on_change(self, kind, event_type, namespace, name, api_object=None):
+        """A `ClusterState.subscribe` callback which queues finished jobs for archiving"""
+        if kind == "job" and event_type != "DELETED" and job_finished(api_object):
+            if not os.path.exists(os.path.join(self.root, namespace, name)):
+                self._queue.put(api_object)
+
+    def _run(self):
+        last_prune = 0
+        while True:
+            try:
+                job = self._queue.get(timeout=PRUNE_INTERVAL)
+                self.archive_job(job)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                log.error(f"archiving failed: {e}")
+
+            if time.time() - last_prune > PRUNE_INTERVAL:
+                self.prune()
+                last_prune = time.time()
+
+    def archive_job(self, job: object):
+        """Archive the logs of every terminated pod of a job, unless already archived
+
+        Jobs which finished before the retention period are skipped, ie: the old
+        jobs seen by the cache's initial list after a restart.
+        """
+        namespace = job.metadata.namespace
+        job_dir = os.path.join(self.root, namespace, job.metadata.name)
+        start = job.status.start_time or job.metadata.creation_timestamp
+        end = job.status.completion_time
+        for condition in job.status.conditions or []:
+            end = end or condition.last_transition_time
+        if end and end.timestamp() < time.time() - self.retention:
+            return
+
+        try:
+            os.makedirs(job_dir)
+        except FileExistsError:
+            # Already archived, or being archived by another process
+            return
+
+        try:
+            self.throttle()
+            pods = self.core.list_namespaced_pod(
+                namespace=namespace, label_selector=f"job-name={job.metadata.name}"
+            ).items
+        except ApiException as e:
+            log.error(f"listing pods of {namespace}/{job.metadata.name}: {e.reason}")
+            os.rmdir(job_dir)
+            return
+
+        archived = 0
+        for pod in pods:
+            if pod.status.phase not in ("Succeeded", "Failed"):
+                continue
+            for container in pod.spec.containers:
+                entry = {
+                    "namespace": namespace,
+                    "cronjob": owner_cronjob(job),
+                    "job": job.metadata.name,
+                    "pod": pod.metadata.name,
+                    "container": container.name,
+                    "start": start.timestamp() if start else None,
+                    "end": end.timestamp() if end else time.time(),
+                }
+                try:
+                    entry["chunks"] = self._archive_container(job_dir, entry)
+                except ApiException as e:
+                    log.error(
+                        f"reading logs of {namespace}/{pod.metadata.name}: {e.reason}"
+                    )
+                    continue
+                self._append_index(entry)
+                archived += 1
+
+        if not archived:
+            # Only indexed runs are pruned, so unclaim the job rather than leaving an
+            # empty directory behind. It is tried again if the job changes, ie: once
+            # its pods finish terminating.
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _archive_container(self, job_dir: str, entry: dict) -> List[dict]:
+        """Stream a container's logs into chunk files and return their metadata"""
+        container_dir = os.path.join(job_dir, entry["pod"], entry["container"])
+        os.makedirs(container_dir, exist_ok=True)
+        self.throttle()
+        response = self.core.read_namespaced_pod_log(
+            entry["pod"],
+            entry["namespace"],
+            container=entry["container"],
+            timestamps=True,
+            _preload_content=False,
+        )
+
+        chunks = []
+        lines = []
+        size = 0
+        partial = b""
+        try:
+            for data in response.stream(64 * 1024):
+                *complete, partial = (partial + data).split(b"\n")
+                for line in complete:
+                    lines.append(line)
+                    size += len(line) + 1
+                    if size >= CHUNK_SIZE:
+                        chunks.append(
+                            self._write_chunk(container_dir, len(chunks), lines)
+                        )
+                        lines, size = [], 0
+        finally:
+            response.release_conn()
+
+        if partial:
+            lines.append(partial)
+        if lines or not chunks:
+            chunks.append(self._write_chunk(container_dir, len(chunks), lines))
+        return chunks
+
+    def _write_chunk(self, container_dir: str, number: int, lines: List[bytes]) -> dict:
+        data = b"\n".join(lines) + b"\n"
+        path = os.path.join(container_dir, f"{number:05d}")
+        compressed, bloom = run_blocking(_encode_chunk, data)
+        with open(f"{path}.log.gz", "wb") as f:
+            f.write(compressed)
+        with open(f"{path}.bloom", "wb") as f:
+            f.write(bloom)
+        return {
+            "path": os.path.relpath(path, self.root),
+            "lines": len(lines),
+            "bytes": len(data),
+        }
+
+    def _index_lock(self, operation: int) -> int:
+        """Open and lock the index lock file, returning the fd to close to unlock"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, operation)
+        return fd
+
+    def _append_index(self, entry: dict):
+        line = (json.dumps(entry) + "\n").encode()
+        lock = self._index_lock(fcntl.LOCK_SH)
+        try:
+            # A single O_APPEND write keeps lines from several processes intact
+            fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        finally:
+            os.close(lock)
+
+    def entries(self) -> List[dict]:
+        """Return all index entries, reading only what was appended since the last call"""
+        with self._lock:
+            try:
+                with open(self.index_path, "rb") as f:
+                    inode = os.fstat(f.fileno()).st_ino
+                    if inode != self._index_inode:
+                        # The index was replaced by a prune, possibly in another process
+                        self._entries, self._index_offset = [], 0
+                        self._index_inode = inode
+                    f.seek(self._index_offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        self._entries.append(json.loads(line))
+                        self._index_offset += len(line)
+            except FileNotFoundError:
+                self._entries, self._index_offset, self._index_inode = [], 0, None
+            return list(self._entries)
+
+    def prune(self):
+        """Delete archived runs older than the retention period and rewrite the index
+
+        Every process sharing the archive prunes it, one at a time: the index is
+        locked against appends and other prunes, and re-read, while it is rewritten.
+        """
+        cutoff = time.time() - self.retention
+        lock = self._index_lock(fcntl.LOCK_EX)
+        try:
+            entries = self.entries()
+            expired = [entry for entry in entries if entry["end"] < cutoff]
+            if not expired:
+                return
+
+            kept = [entry for entry in entries if entry["end"] >= cutoff]
+            tmp_path = f"{self.index_path}.{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in kept)
+            os.replace(tmp_path, self.index_path)
+        finally:
+            os.close(lock)
+
+        for entry in expired:
+            shutil.rmtree(
+                os.path.join(self.root, entry["namespace"], entry["job"]),
+                ignore_errors=True,
+            )
+        log.info(f"pruned {len(expired)} archived container logs")
+
+    def find(
+        self,
+        namespace: str,
+        cronjob: str = None,
+        job: str = None,
+        pod: str = None,
+        since: float = None,
+        until: float = None,
+    ) -> List[dict]:
+        """Return index entries matching the given filters, newest first"""
+        matches = [
+            entry
+            for entry in self.entries()
+            if entry["namespace"] == namespace
+            and (cronjob is None or entry["cronjob"] == cronjob)
+            and (job is None or entry["job"] == job)
+            and (pod is None or entry["pod"] == pod)
+            and (since is None or entry["end"] >= since)
+            and (until is None or (entry["start"] or 0) <= until)
+        ]
+        return sorted(matches, key=lambda entry: entry["end"], reverse=True)
+
+    def read(self, namespace: str, pod: str) -> Iterator[str]:
+        """Yield the archived log text of every container of a pod"""
+        for entry in self.find(namespace, pod=pod):
+            for chunk in entry["chunks"]:
+                try:
+                    f = gzip.open(self._chunk_path(chunk, "log.gz"), "rt")
+                except FileNotFoundError:
+                    # Pruned since the index was read
+                    return
+                with f:
+                    yield from f
+
+    def _chunk_path(self, chunk: dict, extension: str) -> str:
+        return os.path.join(self.root, f"{chunk['path']}.{extension}")
+
+    def search(
+        self,
+        query: str,
+        namespace: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_matches: int = 1000,
+        **filters,
+    ) -> Iterator[str]:
+        """Yield archived log lines containing `query` (case-insensitive), newest runs first
+
+        Chunks whose bloom filter rules out the query are skipped without being read.
+        The scan stops after `max_matches` lines, or once `max_bytes` of decompressed
+        logs have been read, so a broad query can't scan the entire archive.
+
+        Args:
+            query (str): The text to search for
+            namespace (str): The namespace of the runs to search
+            max_bytes (int, optional): Decompressed bytes to scan at most
+            max_matches (int, optional): Matching lines to return at most
+            **filters: `cronjob`, `job`, `pod`, `since` and `until`, see `find`
+
+        Yields:
+            str: Matching lines, prefixed with `[pod/<pod>/<container>]` like `kubectl logs --prefix`
+        """
+        needle = query.lower().encode()
+        scanned = 0
+        matched = 0
+        for entry in self.find(namespace, **filters):
+            prefix = f"[pod/{entry['pod']}/{entry['container']}] "
+            for chunk in entry["chunks"]:
+                try:
+                    with open(self._chunk_path(chunk, "bloom"), "rb") as f:
+                        if not bloom_may_contain(f.read(), needle):
+                            continue
+                    f = gzip.open(self._chunk_path(chunk, "log.gz"), "rb")
+                except FileNotFoundError:
+                    # Pruned since the index was read
+                    break
+                if scanned + chunk["bytes"] > max_bytes:
+                    f.close()
+                    yield f"Kronic> Search stopped after scanning {scanned} bytes\n"
+                    return
+                scanned += chunk["bytes"]
+                with f:
+                    for line in f:
+                        if needle in line.lower():
+                            yield prefix + line.decode(errors="replace")
+                            matched += 1
+                            if matched >= max_matches:
+                                return
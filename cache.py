@@ -0,0 +1,491 @@
+import logging
+import queue
+import sys
+import threading
+import time
+
+from datetime import datetime, timezone
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from typing import Callable, Dict, List, Tuple
+
+import config
+
+log = logging.getLogger("app.cache")
+
+# Seconds a single watch request stays open before being renewed
+WATCH_TIMEOUT = 300
+# Maximum seconds to back off after a failed list or watch
+MAX_BACKOFF = 30
+# Objects `ClusterState.replace` applies before letting other greenlets run
+REPLACE_BATCH = 100
+# Attempts at looking up the exit code of a failed job's pod before giving up
+EXIT_CODE_ATTEMPTS = 5
+
+
+def owner_cronjob(job: object) -> str:
+    """Return the name of the CronJob a Job was created from, or None
+
+    Args:
+        job (V1Job): A Job API object
+
+    Returns:
+        str: The owning CronJob name, either from an ownerReference or from the
+            label kronic sets on manually triggered jobs
+    """
+    for owner_ref in job.metadata.owner_references or []:
+        if owner_ref.kind == "CronJob":
+            return owner_ref.name
+    labels = job.metadata.labels or {}
+    return labels.get("kronic.mshade.org/created-from")
+
+
+def _job_failure(job: object) -> dict:
+    """Return the failure details of a Job, or None if it has not failed
+
+    A `Failed` condition is authoritative, as is a `Complete` one. Without either,
+    a Job is considered failing as soon as any of its pods failed, which matches
+    what the namespace page has always shown.
+
+    Args:
+        job (V1Job): A Job API object
+
+    Returns:
+        dict: The `reason` and `message` of the failure, or None
+    """
+    status = job.status
+    if not status:
+        return None
+    for condition in status.conditions or []:
+        if condition.status != "True":
+            continue
+        if condition.type == "Failed":
+            return {"reason": condition.reason, "message": condition.message}
+        if condition.type == "Complete":
+            return None
+    if status.failed:
+        return {"reason": "PodFailed", "message": f"{status.failed} pod(s) failed"}
+    return None
+
+
+def _summarize_job(job: object) -> dict:
+    """Reduce a Job API object to the few fields the cache aggregates on"""
+    start = job.status.start_time if job.status else None
+    start = start or job.metadata.creation_timestamp
+    return {
+        "name": job.metadata.name,
+        "namespace": job.metadata.namespace,
+        "cronjob": owner_cronjob(job),
+        "start": start.timestamp() if start else 0,
+        "active": bool(job.status and job.status.active),
+        "failure": _job_failure(job),
+    }
+
+
+def _on_gevent() -> bool:
+    """True when gevent has patched threading, ie: in a gunicorn gevent worker"""
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+
+    return monkey.is_module_patched("threading")
+
+
+def run_blocking(func: Callable, *args) -> object:
+    """Call CPU-bound `func(*args)` without stalling the worker
+
+    Under gevent, background "threads" are greenlets sharing the hub with requests,
+    so `func` runs on a real thread of the hub's threadpool instead. Otherwise it is
+    called directly.
+    """
+    if _on_gevent():
+        import gevent
+
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+def unthrottled():
+    """The default `throttle` of background API callers, which doesn't wait"""
+
+
+class Reflector:
+    """List and then watch a resource, keeping a store up to date from the events
+
+    A full list is made at startup and whenever the watch falls too far behind
+    (HTTP 410), after which the store only receives individual changes.
+
+    Args:
+        name (str): A name for logging and the background thread
+        list_func (function): A kubernetes client list function, eg: `list_namespaced_job`
+        store (ClusterState): Receives `replace(kind, scope, objects)` and
+            `apply(kind, event_type, object)` calls
+        kind (str): The kind of object passed to the store, eg: "cronjob"
+        throttle (function, optional): Called before each list or watch request, to
+            wait for the rate limit, see `kron.throttle`
+        **list_kwargs: Extra arguments to `list_func`, ie: `namespace`
+    """
+
+    def __init__(
+        self,
+        name: str,
+        list_func: Callable,
+        store: object,
+        kind: str,
+        throttle: Callable = None,
+        **list_kwargs,
+    ):
+        self.name = name
+        self.list_func = list_func
+        self.store = store
+        self.kind = kind
+        self.throttle = throttle or unthrottled
+        self.list_kwargs = list_kwargs
+        self.scope = list_kwargs.get("namespace")
+        self.synced = threading.Event()
+        self._stop = threading.Event()
+        self._watch = None
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name=f"reflector-{self.name}")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch:
+            self._watch.stop()
+
+    def run(self):
+        backoff = 1
+        resource_version = None
+        while not self._stop.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self._list()
+                    self.synced.set()
+                resource_version = self._watch_from(resource_version)
+                backoff = 1
+            except ApiException as e:
+                if e.status == 410:
+                    log.info(f"{self.name}: watch expired, relisting")
+                    resource_version = None
+                    continue
+                log.error(f"{self.name}: {e.status} {e.reason}")
+            except Exception as e:
+                log.error(f"{self.name}: {e}")
+                resource_version = None
+
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def _list(self) -> str:
+        self.throttle()
+        response = self.list_func(**self.list_kwargs)
+        self.store.replace(self.kind, self.scope, response.items)
+        return response.metadata.resource_version
+
+    def _watch_from(self, resource_version: str) -> str:
+        self.throttle()
+        self._watch = watch.Watch()
+        for event in self._watch.stream(
+            self.list_func,
+            resource_version=resource_version,
+            timeout_seconds=WATCH_TIMEOUT,
+            **self.list_kwargs,
+        ):
+            self.store.apply(self.kind, event["type"], event["object"])
+            if self._stop.is_set():
+                break
+        return self._watch.resource_version or resource_version
+
+
+def _pod_exit_code(pod: object) -> dict:
+    """Return the first non-zero container exit code of a pod, or None
+
+    Args:
+        pod (V1Pod): A pod API object
+
+    Returns:
+        dict: The `pod` name, its `exitCode` and the termination `exitReason`, or None
+    """
+    for container in (pod.status and pod.status.container_statuses) or []:
+        for state in (container.state, container.last_state):
+            terminated = state and state.terminated
+            if terminated and terminated.exit_code:
+                return {
+                    "pod": pod.metadata.name,
+                    "exitCode": terminated.exit_code,
+                    "exitReason": terminated.reason,
+                }
+    return None
+
+
+class ClusterState:
+    """An in-memory, incrementally maintained view of the CronJobs and Jobs in a cluster
+
+    Only a compact summary of each object is retained, so pages like the index can be
+    served from memory instead of listing and serializing every CronJob per request.
+
+    Args:
+        batch_api (BatchV1Api): The client used to list and watch CronJobs and Jobs
+        core_api (CoreV1Api, optional): The client used to look up the exit code of
+            pods belonging to failed jobs. Exit codes are not collected without it.
+        throttle (function, optional): Called before each API request, to wait for
+            the rate limit, see `kron.throttle`
+    """
+
+    def __init__(
+        self, batch_api: object, core_api: object = None, throttle: Callable = None
+    ):
+        self.batch = batch_api
+        self.core = core_api
+        self.throttle = throttle or unthrottled
+        self.reflectors: List[Reflector] = []
+        # (namespace, job name, attempt) of newly failed jobs awaiting a pod exit code lookup
+        self._exit_code_queue = queue.Queue()
+        self._lock = threading.RLock()
+        # (namespace, name) -> {"suspend": bool}
+        self.cronjobs: Dict[Tuple[str, str], dict] = {}
+        # (namespace, name) -> job summary, see `_summarize_job`
+        self.jobs: Dict[Tuple[str, str], dict] = {}
+        # (namespace, cronjob name) -> set of job names
+        self._jobs_by_cronjob: Dict[Tuple[str, str], set] = {}
+        # (namespace, cronjob name) -> summary of its latest, failed job
+        self.failing: Dict[Tuple[str, str], dict] = {}
+        # Called with (kind, event_type, namespace, name, api_object) for every change
+        self._subscribers: List[Callable] = []
+
+    def start(self):
+        """Start background reflectors for CronJobs and Jobs in the allowed namespaces"""
+        if config.ALLOW_NAMESPACES:
+            for namespace in config.ALLOW_NAMESPACES.split(","):
+                self._add_reflector(
+                    f"cronjobs-{namespace}",
+                    self.batch.list_namespaced_cron_job,
+                    "cronjob",
+                    namespace=namespace,
+                )
+                self._add_reflector(
+                    f"jobs-{namespace}",
+                    self.batch.list_namespaced_job,
+                    "job",
+                    namespace=namespace,
+                )
+        else:
+            self._add_reflector(
+                "cronjobs", self.batch.list_cron_job_for_all_namespaces, "cronjob"
+            )
+            self._add_reflector("jobs", self.batch.list_job_for_all_namespaces, "job")
+
+        for reflector in self.reflectors:
+            reflector.start()
+
+        if self.core:
+            thread = threading.Thread(
+                target=self._collect_exit_codes, name="exit-codes"
+            )
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        for reflector in self.reflectors:
+            reflector.stop()
+        self._exit_code_queue.put(None)
+
+    def subscribe(self, callback: Callable):
+        """Register a callback for every CronJob and Job change applied to the store
+
+        The callback is invoked on a reflector thread as
+        `callback(kind, event_type, namespace, name, api_object)`, where `api_object`
+        is None for deletions detected by a relist. It must not block.
+        """
+        self._subscribers.append(callback)
+
+    def _notify(self, kind, event_type, namespace, name, api_object=None):
+        for callback in self._subscribers:
+            try:
+                callback(kind, event_type, namespace, name, api_object)
+            except Exception as e:
+                log.error(f"subscriber {callback}: {e}")
+
+    def _add_reflector(self, name: str, list_func: Callable, kind: str, **kwargs):
+        self.reflectors.append(
+            Reflector(name, list_func, self, kind, self.throttle, **kwargs)
+        )
+
+    @property
+    def ready(self) -> bool:
+        """True once every reflector has completed its initial list"""
+        return bool(self.reflectors) and all(r.synced.is_set() for r in self.reflectors)
+
+    def replace(self, kind: str, scope: str, objects: List[object]):
+        """Replace all objects of `kind` in `scope` (a namespace, or None for all)
+
+        Objects are applied in batches of REPLACE_BATCH, so readers may see a mix of
+        listed and not yet updated objects until the replace completes, like they
+        would with watch events.
+        """
+        store = self.cronjobs if kind == "cronjob" else self.jobs
+        listed = set()
+        for start in range(0, len(objects), REPLACE_BATCH):
+            if start:
+                # Indexing a large list takes a while, so let requests, including
+                # those reading the store, run between batches. Only yields under
+                # gevent.
+                time.sleep(0)
+            with self._lock:
+                for api_object in objects[start : start + REPLACE_BATCH]:
+                    self.apply(kind, "ADDED", api_object)
+                    listed.add(
+                        (api_object.metadata.namespace, api_object.metadata.name)
+                    )
+        with self._lock:
+            stale = [
+                key
+                for key in store
+                if key not in listed and (scope is None or key[0] == scope)
+            ]
+            for namespace, name in stale:
+                self._delete(kind, namespace, name)
+                self._notify(kind, "DELETED", namespace, name)
+
+    def apply(self, kind: str, event_type: str, api_object: object):
+        """Apply a single watch event to the store"""
+        namespace = api_object.metadata.namespace
+        name = api_object.metadata.name
+        with self._lock:
+            if event_type == "DELETED":
+                self._delete(kind, namespace, name)
+            elif kind == "cronjob":
+                spec = api_object.spec
+                self.cronjobs[(namespace, name)] = {
+                    "suspend": bool(spec and spec.suspend)
+                }
+            else:
+                self._set_job(_summarize_job(api_object))
+            self._notify(kind, event_type, namespace, name, api_object)
+
+    def _delete(self, kind: str, namespace: str, name: str):
+        if kind == "cronjob":
+            self.cronjobs.pop((namespace, name), None)
+            return
+        job = self.jobs.pop((namespace, name), None)
+        if job and job["cronjob"]:
+            owner = (namespace, job["cronjob"])
+            self._jobs_by_cronjob.get(owner, set()).discard(name)
+            if not self._jobs_by_cronjob.get(owner):
+                self._jobs_by_cronjob.pop(owner, None)
+            self._refresh_failing(owner)
+
+    def _set_job(self, job: dict):
+        key = (job["namespace"], job["name"])
+        previous = self.jobs.get(key)
+        if previous and job["failure"] and previous["failure"]:
+            # Keep an exit code that was already looked up for this failure
+            job["failure"] = {**previous["failure"], **job["failure"]}
+        self.jobs[key] = job
+        if job["cronjob"]:
+            owner = (job["namespace"], job["cronjob"])
+            self._jobs_by_cronjob.setdefault(owner, set()).add(job["name"])
+            self._refresh_failing(owner)
+
+    def _refresh_failing(self, owner: Tuple[str, str]):
+        """Recompute whether the latest job of a CronJob has failed"""
+        namespace = owner[0]
+        jobs = [
+            self.jobs[(namespace, name)]
+            for name in self._jobs_by_cronjob.get(owner, ())
+        ]
+        latest = max(jobs, key=lambda job: job["start"], default=None)
+        if latest and latest["failure"]:
+            previous = self.failing.get(owner)
+            is_new = not previous or previous["name"] != latest["name"]
+            if is_new and self.core and "exitCode" not in latest["failure"]:
+                self._exit_code_queue.put((namespace, latest["name"], 1))
+            self.failing[owner] = latest
+        else:
+            self.failing.pop(owner, None)
+
+    def _collect_exit_codes(self):
+        """Look up pod exit codes of newly failed jobs, one pod LIST per failed job"""
+        while True:
+            item = self._exit_code_queue.get()
+            if item is None:
+                return
+            namespace, job_name, attempt = item
+            try:
+                self.throttle()
+                pods = self.core.list_namespaced_pod(
+                    namespace=namespace, label_selector=f"job-name={job_name}"
+                ).items
+            except ApiException as e:
+                log.error(f"exit code lookup for {namespace}/{job_name}: {e.reason}")
+                if attempt < EXIT_CODE_ATTEMPTS:
+                    retry = threading.Timer(
+                        min(2**attempt, MAX_BACKOFF),
+                        self._exit_code_queue.put,
+                        args=((namespace, job_name, attempt + 1),),
+                    )
+                    retry.daemon = True
+                    retry.start()
+                    continue
+                # Give up, rather than showing the lookup as pending forever
+                pods = []
+
+            exit_code = next(filter(None, map(_pod_exit_code, pods)), None)
+            with self._lock:
+                job = self.jobs.get((namespace, job_name))
+                if job and job["failure"] is not None:
+                    job["failure"].update(exit_code or {"exitCode": None})
+
+    def namespace_summary(self) -> Dict[str, dict]:
+        """Count CronJobs per namespace, along with how many are suspended or failing
+
+        Returns:
+            dict: namespace -> {"cronjobs": int, "suspended": int, "failing": int}
+        """
+        with self._lock:
+            namespaces = {}
+            for (namespace, name), cronjob in self.cronjobs.items():
+                counts = namespaces.setdefault(
+                    namespace, {"cronjobs": 0, "suspended": 0, "failing": 0}
+                )
+                counts["cronjobs"] += 1
+                counts["suspended"] += cronjob["suspend"]
+                counts["failing"] += (namespace, name) in self.failing
+        return dict(sorted(namespaces.items()))
+
+    def active_jobs(self) -> List[dict]:
+        """Return summaries of the running jobs created by CronJobs, see `_summarize_job`"""
+        with self._lock:
+            return [
+                dict(job)
+                for job in self.jobs.values()
+                if job["active"] and job["cronjob"]
+            ]
+
+    def failing_jobs(self) -> List[dict]:
+        """Return the latest job of each CronJob whose latest job failed, newest first
+
+        Returns:
+            List of dicts: The namespace, cronjob and job name, start time and failure
+                details including the pod exit code, once it has been looked up
+        """
+        with self._lock:
+            latest_jobs = [
+                job for owner, job in self.failing.items() if owner in self.cronjobs
+            ]
+            latest_jobs.sort(key=lambda job: job["start"], reverse=True)
+            return [
+                {
+                    "namespace": job["namespace"],
+                    "cronjob": job["cronjob"],
+                    "job": job["name"],
+                    "startTime": datetime.fromtimestamp(
+                        job["start"], timezone.utc
+                    ).isoformat(),
+                    **job["failure"],
+                }
+                for job in latest_jobs
+            ]
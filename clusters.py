@@ -0,0 +1,116 @@
+import functools
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Tuple
+
+import config
+import kron
+from cache import ClusterState
+from search import SearchIndex
+
+log = logging.getLogger("app.clusters")
+
+# Name of the cluster when Kronic is not configured with KRONIC_CLUSTERS
+DEFAULT_CLUSTER = "default"
+# Concurrent fan-out calls per cluster. An unreachable cluster can only tie up its own.
+WORKERS_PER_CLUSTER = 4
+
+
+class Cluster:
+    """The API clients, connection pool, cache and search index of a single cluster
+
+    Args:
+        name (str): The cluster name, ie: its kubeconfig context
+        clients (dict): The `v1`, `batch` and `generic` clients, see `kron.create_clients`
+    """
+
+    def __init__(self, name: str, clients: dict):
+        self.name = name
+        self.clients = clients
+        # Background API callers share the rate limit of requests to this cluster
+        self.throttle = functools.partial(kron.throttle, clients)
+        self.state = ClusterState(clients["batch"], clients["v1"], self.throttle)
+        self.search = SearchIndex()
+        self.state.subscribe(self.search.on_change)
+        self.archive = None
+        self.usage = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=WORKERS_PER_CLUSTER, thread_name_prefix=f"cluster-{name}"
+        )
+
+    def start(self):
+        self.state.start()
+        if self.archive:
+            self.archive.start()
+        if self.usage:
+            self.usage.start()
+
+    def submit(self, func: Callable, *args, **kwargs):
+        """Run `func` on this cluster's executor, with the `kron` clients selected"""
+
+        def run():
+            token = kron.select_clients(self.clients)
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                kron.reset_clients(token)
+
+        return self._executor.submit(run)
+
+
+def load_clusters() -> Dict[str, Cluster]:
+    """Create a Cluster for each context in KRONIC_CLUSTERS, or a single default one"""
+    if not config.CLUSTERS:
+        return {DEFAULT_CLUSTER: Cluster(DEFAULT_CLUSTER, kron.default_clients)}
+
+    clusters = {}
+    for context in config.CLUSTERS.split(","):
+        clusters[context] = Cluster(context, kron.create_clients(context))
+    return clusters
+
+
+def fan_out(
+    func: Callable, clusters: Iterable[Cluster], timeout: float = None
+) -> Tuple[Dict[str, object], Dict[str, str]]:
+    """Call `func(cluster)` for every cluster concurrently and gather the results
+
+    Results are returned after at most `timeout` seconds. Clusters which haven't
+    answered by then, or which raised an exception, are reported as errors instead,
+    so one slow or unreachable cluster can't stall an aggregated view. API calls
+    made by `func` time out after `timeout` as well, which frees the cluster's
+    workers for later calls.
+
+    Args:
+        func (function): Called with each Cluster, with its `kron` clients selected
+        clusters (Iterable of Cluster): The clusters to call
+        timeout (float, optional): Seconds to wait. Defaults to KRONIC_CLUSTER_TIMEOUT.
+
+    Returns:
+        tuple: A dict of cluster name -> result, and a dict of cluster name -> error
+    """
+    if timeout is None:
+        timeout = config.CLUSTER_TIMEOUT
+
+    def call(cluster):
+        token = kron.set_request_timeout(timeout)
+        try:
+            return func(cluster)
+        finally:
+            kron.reset_request_timeout(token)
+
+    futures = {cluster.name: cluster.submit(call) for cluster in clusters}
+    wait(futures.values(), timeout=timeout)
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[name] = f"No response within {timeout}s"
+        elif future.exception():
+            log.error(f"{name}: {future.exception()}")
+            errors[name] = str(future.exception())
+        else:
+            results[name] = future.result()
+    return results, errors
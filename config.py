@@ -4,7 +4,6 @@ import sys
 
 from werkzeug.security import generate_password_hash
 
-
 log = logging.getLogger("app.config")
 
 ## Configuration Setings
@@ -18,6 +17,35 @@ ALLOW_NAMESPACES = os.environ.get("KRONIC_ALLOW_NAMESPACES", None)
 # Limit to local namespace. Supercedes `ALLOW_NAMESPACES`
 NAMESPACE_ONLY = os.environ.get("KRONIC_NAMESPACE_ONLY", False)
 
+# Comma separated list of kubeconfig contexts to manage. Uses the in-cluster or
+# current kubeconfig context if unset
+CLUSTERS = os.environ.get("KRONIC_CLUSTERS", None)
+
+# Seconds to wait for each cluster when aggregating across clusters
+CLUSTER_TIMEOUT = float(os.environ.get("KRONIC_CLUSTER_TIMEOUT", 5))
+
+# Requests per second each worker may send to each cluster's API server, and how many
+# may be sent in a burst. Single writes go ahead of reads. Set KRONIC_API_QPS to 0 to disable
+API_QPS = float(os.environ.get("KRONIC_API_QPS", 50))
+API_BURST = int(os.environ.get("KRONIC_API_BURST", 100))
+
+# CronJobs applied concurrently by a bulk import
+IMPORT_CONCURRENCY = int(os.environ.get("KRONIC_IMPORT_CONCURRENCY", 8))
+
+# Disable the background watches which keep CronJob and Job summaries in memory
+DISABLE_CACHE = os.environ.get("KRONIC_DISABLE_CACHE", False)
+
+# Directory to archive logs of finished jobs' pods to. Archiving is disabled if unset
+LOG_ARCHIVE_DIR = os.environ.get("KRONIC_LOG_ARCHIVE_DIR", None)
+
+# Days to keep archived logs for
+LOG_ARCHIVE_RETENTION_DAYS = int(os.environ.get("KRONIC_LOG_ARCHIVE_RETENTION_DAYS", 7))
+
+# Seconds between samples of running jobs' CPU and memory usage from the metrics API
+# (metrics-server), and runs to keep per CronJob. Set KRONIC_USAGE_INTERVAL to 0 to disable
+USAGE_INTERVAL = float(os.environ.get("KRONIC_USAGE_INTERVAL", 30))
+USAGE_HISTORY = int(os.environ.get("KRONIC_USAGE_HISTORY", 50))
+
 # Boolean of whether this is a test environment, disables kubeconfig setup
 TEST = os.environ.get("KRONIC_TEST", False)
 
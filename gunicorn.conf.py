@@ -0,0 +1,21 @@
+"""Gunicorn settings, see https://docs.gunicorn.org/en/stable/settings.html
+
+Kronic runs on gevent workers by default. gevent patches sockets, so calls to the
+Kubernetes API yield to other requests instead of blocking the worker. A followed
+pod log only holds one greenlet, which lets thousands of open streams share a
+worker with regular requests.
+"""
+
+import os
+
+bind = os.environ.get("KRONIC_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("KRONIC_WORKERS", 4))
+
+# `gevent` (default), or `gthread` / `sync` to run without gevent
+worker_class = os.environ.get("KRONIC_WORKER_CLASS", "gevent")
+# Concurrent connections per gevent worker
+worker_connections = int(os.environ.get("KRONIC_WORKER_CONNECTIONS", 1000))
+# Threads per gthread worker
+threads = int(os.environ.get("KRONIC_THREADS", 1))
+
+accesslog = "-"
@@ -1,11 +1,17 @@
+import codecs
+import contextvars
+import json
 import logging
+import threading
+import time
 
 from kubernetes import client
 from kubernetes import config as kubeconfig
 from kubernetes.config import ConfigException
 from kubernetes.client.rest import ApiException
 from datetime import datetime, timezone
-from typing import List
+from functools import lru_cache
+from typing import Callable, Iterator, List
 
 import config
 
@@ -19,10 +25,205 @@ if not config.TEST:
         # Load configuration from KUBECONFIG
         kubeconfig.load_kube_config()
 
+
+def create_clients(context: str = None) -> dict:
+    """Create API clients with their own connection pool
+
+    Args:
+        context (str, optional): A kubeconfig context to connect to. Defaults to None,
+            which uses the configuration loaded above.
+
+    Returns:
+        dict: The `v1`, `batch`, `custom` and `generic` clients
+    """
+    api_client = client.ApiClient()
+    if context:
+        api_client = kubeconfig.new_client_from_config(context=context)
+    return {
+        "v1": client.CoreV1Api(api_client),
+        "batch": client.BatchV1Api(api_client),
+        "custom": client.CustomObjectsApi(api_client),
+        "generic": api_client,
+    }
+
+
+# The clients of the cluster selected for the current request or thread
+_selected_clients = contextvars.ContextVar("selected_clients", default=None)
+
+
+def select_clients(clients: dict) -> contextvars.Token:
+    """Route calls made through `v1`, `batch` and `generic` in the current context to
+    the given clients, see `create_clients`. Returns a token for `reset_clients`."""
+    return _selected_clients.set(clients)
+
+
+def reset_clients(token: contextvars.Token):
+    _selected_clients.reset(token)
+
+
+# Seconds API calls in the current context may take, ie: when aggregating clusters
+_request_timeout = contextvars.ContextVar("request_timeout", default=None)
+
+
+def set_request_timeout(seconds: float) -> contextvars.Token:
+    """Time out API calls made in the current context after `seconds`, so an
+    unreachable cluster can't hold on to a thread. Returns a token for
+    `reset_request_timeout`."""
+    return _request_timeout.set(seconds)
+
+
+def reset_request_timeout(token: contextvars.Token):
+    _request_timeout.reset(token)
+
+
+class _SelectedClient:
+    """Delegates to the client of the selected cluster, or to a default client"""
+
+    def __init__(self, kind: str, default: object):
+        self._kind = kind
+        self._default = default
+
+    def __getattr__(self, attr):
+        clients = _selected_clients.get()
+        return getattr(clients[self._kind] if clients else self._default, attr)
+
+
 # Create the Api clients
-v1 = client.CoreV1Api()
-batch = client.BatchV1Api()
-generic = client.ApiClient()
+default_clients = create_clients()
+v1 = _SelectedClient("v1", default_clients["v1"])
+batch = _SelectedClient("batch", default_clients["batch"])
+generic = _SelectedClient("generic", default_clients["generic"])
+
+
+class _TokenBucket:
+    """Limit the rate of calls to an API server, letting writes go first
+
+    Reads wait for a token. Writes take one without waiting, going into debt if
+    needed, so interactive actions aren't slowed down by a burst of reads; the debt
+    is paid back by the reads that follow. The debt is capped at `burst` tokens, so
+    a run of writes can hold reads back by about `burst / rate` seconds at most.
+
+    Args:
+        rate (float): Tokens added per second. 0 disables the limit.
+        burst (int): Maximum tokens saved up while idle
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority: bool = False):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                # Writes may take tokens down to -burst, reads only down to 0
+                floor = -self.burst if priority else 0
+                if self.tokens - 1 >= floor:
+                    self.tokens -= 1
+                    return
+                wait = (floor + 1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class _SingleFlight:
+    """Let concurrent, identical calls share the result of a single in-flight call"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: tuple, func: Callable) -> object:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event()}
+
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = func()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+
+_in_flight = _SingleFlight()
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _rate_limiter(clients: dict = None) -> _TokenBucket:
+    """Return the rate limiter of a cluster's clients, by default the selected ones"""
+    clients = clients or _selected_clients.get() or default_clients
+    with _rate_limiters_lock:
+        if id(clients) not in _rate_limiters:
+            _rate_limiters[id(clients)] = _TokenBucket(config.API_QPS, config.API_BURST)
+        return _rate_limiters[id(clients)]
+
+
+def throttle(clients: dict = None, priority: bool = False):
+    """Wait for the rate limit of a cluster before calling its API server directly
+
+    For background callers which don't go through `_read`, like watches and the
+    archive, so they share the limit with requests.
+
+    Args:
+        clients (dict, optional): The cluster's clients. Defaults to the selected cluster.
+        priority (bool): Take a token without waiting, like a write
+    """
+    _rate_limiter(clients).acquire(priority)
+
+
+def _read(func: Callable, *args, **kwargs) -> object:
+    """Call a read-only client method, sharing the call with identical concurrent reads
+
+    Calls are identical when they target the same cluster, method (verb and resource)
+    and arguments (namespace, name, selectors). The shared result must not be
+    modified, which `_clean_api_object` already avoids by copying it to a dict.
+    """
+    clients = _selected_clients.get() or default_clients
+    if _request_timeout.get() and "_request_timeout" not in kwargs:
+        kwargs["_request_timeout"] = _request_timeout.get()
+    key = (id(clients), func.__name__, args, tuple(sorted(kwargs.items())))
+
+    def call():
+        _rate_limiter().acquire()
+        return func(*args, **kwargs)
+
+    return _in_flight.do(key, call)
+
+
+def _write(func: Callable, *args, priority: bool = True, **kwargs) -> object:
+    """Call a client method on behalf of a user action, ahead of rate-limited reads
+
+    Args:
+        priority (bool): Whether to go ahead of reads. Bulk writes, like imports,
+            pass False to wait their turn instead.
+    """
+    if _request_timeout.get() and "_request_timeout" not in kwargs:
+        kwargs["_request_timeout"] = _request_timeout.get()
+    _rate_limiter().acquire(priority)
+    return func(*args, **kwargs)
 
 
 def namespace_filter(func):
@@ -69,37 +270,97 @@ def _clean_api_object(api_object: object) -> dict:
     return api_dict
 
 
-def _get_time_since(datestring: str) -> str:
+# Marks a key or list item missing from one side of `diff_objects`
+_MISSING = object()
+
+
+def _error_message(e: ApiException) -> str:
+    """Return the message of a Kubernetes API error response, or its reason"""
+    try:
+        return json.loads(e.body)["message"]
+    except (TypeError, ValueError, KeyError):
+        return e.reason
+
+
+def diff_objects(old: object, new: object, path: str = "") -> List[dict]:
+    """Compare two API objects as dicts and list the differences
+
+    Args:
+        old (dict): The original object, ie: the live CronJob
+        new (dict): The changed object, ie: the result of a dry-run apply
+        path (str, optional): The path of the objects within a parent object
+
+    Returns:
+        List of dicts: A `path` like `spec.jobTemplate.spec.schedule` or
+            `...containers[0].image`, an `op` of "added", "removed" or "changed",
+            and the `old` and `new` values
     """
-    Calculate the time difference between the input datestring and the current time
-    and return a human-readable string.
+    if isinstance(old, dict) and isinstance(new, dict):
+        keys = sorted(old.keys() | new.keys())
+        paths = [f"{path}.{key}" if path else key for key in keys]
+        old_items = [old.get(key, _MISSING) for key in keys]
+        new_items = [new.get(key, _MISSING) for key in keys]
+    elif isinstance(old, list) and isinstance(new, list):
+        length = max(len(old), len(new))
+        paths = [f"{path}[{i}]" for i in range(length)]
+        old_items = old + [_MISSING] * (length - len(old))
+        new_items = new + [_MISSING] * (length - len(new))
+    elif old != new:
+        return [{"path": path, "op": "changed", "old": old, "new": new}]
+    else:
+        return []
+
+    changes = []
+    for item_path, old_item, new_item in zip(paths, old_items, new_items):
+        if new_item is _MISSING:
+            changes.append(
+                {"path": item_path, "op": "removed", "old": old_item, "new": None}
+            )
+        elif old_item is _MISSING:
+            changes.append(
+                {"path": item_path, "op": "added", "old": None, "new": new_item}
+            )
+        else:
+            changes.extend(diff_objects(old_item, new_item, item_path))
+    return changes
+
+
+@lru_cache(maxsize=65536)
+def _parse_timestamp(datestring: str) -> float:
+    """Parse an ISO timestamp to epoch seconds. Timestamps of an object version never
+    change, so each one is only parsed once.
 
     Args:
-        datestring (str): A string representing a timestamp in ISO format.
+        datestring (str): A string representing a timestamp in ISO format, or None
 
     Returns:
-        str: A human-readable time difference string.
+        float: Seconds since the epoch, or None if no timestamp was given
     """
-    current_time = datetime.now(timezone.utc)
-    input_time = datetime.fromisoformat(datestring)
+    if not datestring:
+        return None
+    return datetime.fromisoformat(datestring).timestamp()
 
-    time_difference = current_time - input_time
 
-    if time_difference.total_seconds() < 0:
-        return "In the future"
+def _set_ages(api_dicts: List[dict], now: float = None):
+    """Set `startTimestamp`, `ageSeconds` and, once finished, `durationSeconds`
+    in the status of each job or pod, relative to a single `now`.
 
-    days = time_difference.days
-    hours, remainder = divmod(time_difference.seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
+    Objects which haven't started yet (ie: pending pods) get None instead. Turning
+    these numbers into human-readable text is left to whatever displays them.
 
-    if days > 0:
-        return f"{days}d {hours}h {minutes}m {seconds}s"
-    elif hours > 0:
-        return f"{hours}h {minutes}m {seconds}s"
-    elif minutes > 0:
-        return f"{minutes}m {seconds}s"
-    else:
-        return f"{seconds}s"
+    Args:
+        api_dicts (List of dict): Jobs or pods as dicts
+        now (float, optional): Epoch seconds to compute ages at. Defaults to now.
+    """
+    if now is None:
+        now = time.time()
+    for api_dict in api_dicts:
+        status = api_dict.setdefault("status", {})
+        start = _parse_timestamp(status.get("startTime"))
+        end = _parse_timestamp(status.get("completionTime"))
+        status["startTimestamp"] = start
+        status["ageSeconds"] = int(now - start) if start is not None else None
+        status["durationSeconds"] = int(end - start) if start and end else None
 
 
 def _has_label(api_object: object, k: str, v: str) -> bool:
@@ -150,7 +411,7 @@ def get_cronjobs(namespace: str = None) -> List[dict]:
             if not config.ALLOW_NAMESPACES:
                 cronjobs = [
                     _clean_api_object(item)
-                    for item in batch.list_cron_job_for_all_namespaces().items
+                    for item in _read(batch.list_cron_job_for_all_namespaces).items
                 ]
             else:
                 cronjobs = []
@@ -158,15 +419,17 @@ def get_cronjobs(namespace: str = None) -> List[dict]:
                     cronjobs.extend(
                         [
                             _clean_api_object(item)
-                            for item in batch.list_namespaced_cron_job(
-                                namespace=allowed
+                            for item in _read(
+                                batch.list_namespaced_cron_job, namespace=allowed
                             ).items
                         ]
                     )
         else:
             cronjobs = [
                 _clean_api_object(item)
-                for item in batch.list_namespaced_cron_job(namespace=namespace).items
+                for item in _read(
+                    batch.list_namespaced_cron_job, namespace=namespace
+                ).items
             ]
 
         fields = ["name", "namespace"]
@@ -182,12 +445,38 @@ def get_cronjobs(namespace: str = None) -> List[dict]:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
 
 
+@namespace_filter
+def iter_cronjobs(namespace: str, page_size: int = 100) -> Iterator[dict]:
+    """Yield every CronJob in a namespace as a dict, fetching them a page at a time
+
+    Args:
+        namespace (str): The namespace
+        page_size (int, optional): CronJobs to request per list call. Defaults to 100.
+
+    Yields:
+        dict: Each CronJob API object, in the order the API server lists them
+    """
+    _continue = None
+    while True:
+        response = _read(
+            batch.list_namespaced_cron_job,
+            namespace=namespace,
+            limit=page_size,
+            _continue=_continue,
+        )
+        for item in response.items:
+            yield _clean_api_object(item)
+        _continue = response.metadata._continue
+        if not _continue:
+            return
+
+
 @namespace_filter
 def get_cronjob(namespace: str, cronjob_name: str) -> dict:
     """Get the details of a given CronJob as a dict
@@ -200,7 +489,7 @@ def get_cronjob(namespace: str, cronjob_name: str) -> dict:
         dict: A dict of the CronJob API object
     """
     try:
-        cronjob = batch.read_namespaced_cron_job(cronjob_name, namespace)
+        cronjob = _read(batch.read_namespaced_cron_job, cronjob_name, namespace)
         return _clean_api_object(cronjob)
     except ApiException:
         return False
@@ -218,7 +507,7 @@ def get_jobs(namespace: str, cronjob_name: str) -> List[dict]:
         List of dicts: A list of dicts of each job created by the given CronJob name
     """
     try:
-        jobs = batch.list_namespaced_job(namespace=namespace)
+        jobs = _read(batch.list_namespaced_job, namespace=namespace)
         cleaned_jobs = [_clean_api_object(job) for job in jobs.items]
 
         filtered_jobs = [
@@ -228,8 +517,7 @@ def get_jobs(namespace: str, cronjob_name: str) -> List[dict]:
             or _has_label(job, "kronic.mshade.org/created-from", cronjob_name)
         ]
 
-        for job in filtered_jobs:
-            job["status"]["age"] = _get_time_since(job["status"]["startTime"])
+        _set_ages(filtered_jobs)
 
         return filtered_jobs
 
@@ -240,7 +528,7 @@ def get_jobs(namespace: str, cronjob_name: str) -> List[dict]:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
@@ -258,14 +546,15 @@ def get_pods(namespace: str, job_name: str = None) -> List[dict]:
         List of dicts: A list of pod dicts
     """
     try:
-        all_pods = v1.list_namespaced_pod(namespace=namespace)
+        all_pods = _read(v1.list_namespaced_pod, namespace=namespace)
         cleaned_pods = [_clean_api_object(pod) for pod in all_pods.items]
         filtered_pods = [
-            pod for pod in cleaned_pods if pod_is_owned_by(pod, job_name) or (not job_name)
+            pod
+            for pod in cleaned_pods
+            if pod_is_owned_by(pod, job_name) or (not job_name)
         ]
 
-        for pod in filtered_pods:
-            pod["status"]["age"] = _get_time_since(pod["status"]["startTime"])
+        _set_ages(filtered_pods)
 
         return filtered_pods
 
@@ -276,7 +565,7 @@ def get_pods(namespace: str, job_name: str = None) -> List[dict]:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
@@ -296,7 +585,9 @@ def get_jobs_and_pods(namespace: str, cronjob_name: str) -> List[dict]:
     jobs = get_jobs(namespace, cronjob_name)
     all_pods = get_pods(namespace)
     for job in jobs:
-        job["pods"] = [pod for pod in all_pods if pod_is_owned_by(pod, job["metadata"]["name"])]
+        job["pods"] = [
+            pod for pod in all_pods if pod_is_owned_by(pod, job["metadata"]["name"])
+        ]
 
     return jobs
 
@@ -305,8 +596,12 @@ def get_jobs_and_pods(namespace: str, cronjob_name: str) -> List[dict]:
 def get_pod_logs(namespace: str, pod_name: str) -> str:
     """Return plain text logs for <pod_name> in <namespace>"""
     try:
-        logs = v1.read_namespaced_pod_log(
-            pod_name, namespace, tail_lines=1000, timestamps=True
+        logs = _read(
+            v1.read_namespaced_pod_log,
+            pod_name,
+            namespace,
+            tail_lines=1000,
+            timestamps=True,
         )
         return logs
 
@@ -315,11 +610,57 @@ def get_pod_logs(namespace: str, pod_name: str) -> str:
             return f"Kronic> Error fetching logs: {e.reason}"
 
 
+def stream_pod_logs(
+    namespace: str, pod_name: str, tail_lines: int = 1000
+) -> Iterator[str]:
+    """Yield plain text logs for <pod_name> in <namespace> as they are written
+
+    The stream stays open until the pod's container exits or the caller closes the
+    generator, ie: when the browser disconnects.
+
+    Args:
+        namespace (str): The namespace of the pod
+        pod_name (str): The name of the pod
+        tail_lines (int, optional): Lines of existing logs to start with. Defaults to 1000.
+
+    Yields:
+        str: Log text, in the chunks it is received in
+    """
+    try:
+        # Not shared with other reads, every follower needs its own stream
+        _rate_limiter().acquire()
+        response = v1.read_namespaced_pod_log(
+            pod_name,
+            namespace,
+            follow=True,
+            tail_lines=tail_lines,
+            timestamps=True,
+            _preload_content=False,
+        )
+    except ApiException as e:
+        yield f"Kronic> Error fetching logs: {e.reason}\n"
+        return
+
+    # Chunks may split multi-byte characters
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        for data in response.stream(64 * 1024):
+            text = decoder.decode(data)
+            if text:
+                yield text
+        yield decoder.decode(b"", final=True)
+    finally:
+        response.release_conn()
+
+
 @namespace_filter
 def trigger_cronjob(namespace: str, cronjob_name: str) -> dict:
     try:
         # Retrieve the CronJob template
-        cronjob = batch.read_namespaced_cron_job(name=cronjob_name, namespace=namespace)
+        # Not shared with other reads, as the job template is modified below
+        cronjob = _write(
+            batch.read_namespaced_cron_job, name=cronjob_name, namespace=namespace
+        )
         job_template = cronjob.spec.job_template
 
         # Create a unique name indicating a manual invocation
@@ -334,8 +675,8 @@ def trigger_cronjob(namespace: str, cronjob_name: str) -> dict:
             "kronic.mshade.org/created-from": cronjob_name,
         }
 
-        trigger_job = batch.create_namespaced_job(
-            body=job_template, namespace=namespace
+        trigger_job = _write(
+            batch.create_namespaced_job, body=job_template, namespace=namespace
         )
         return _clean_api_object(trigger_job)
 
@@ -346,7 +687,7 @@ def trigger_cronjob(namespace: str, cronjob_name: str) -> dict:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
@@ -364,12 +705,17 @@ def toggle_cronjob_suspend(namespace: str, cronjob_name: str) -> dict:
         dict: The full cronjob object is returned as a dict
     """
     try:
-        suspended_status = batch.read_namespaced_cron_job_status(
-            name=cronjob_name, namespace=namespace
+        suspended_status = _write(
+            batch.read_namespaced_cron_job_status,
+            name=cronjob_name,
+            namespace=namespace,
         )
         patch_body = {"spec": {"suspend": not suspended_status.spec.suspend}}
-        cronjob = batch.patch_namespaced_cron_job(
-            name=cronjob_name, namespace=namespace, body=patch_body
+        cronjob = _write(
+            batch.patch_namespaced_cron_job,
+            name=cronjob_name,
+            namespace=namespace,
+            body=patch_body,
         )
         return _clean_api_object(cronjob)
 
@@ -380,29 +726,62 @@ def toggle_cronjob_suspend(namespace: str, cronjob_name: str) -> dict:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
 
 
 @namespace_filter
-def update_cronjob(namespace: str, spec: str) -> dict:
-    """Update/edit a CronJob configuration via patch
+def update_cronjob(
+    namespace: str,
+    spec: str,
+    dry_run: bool = False,
+    bulk: bool = False,
+    force: bool = True,
+) -> dict:
+    """Create or update a CronJob with a single server-side apply as the `kronic` field manager
 
     Args:
         namespace (str): The namespace
         spec (dict): A cronjob spec as a dict object
+        dry_run (bool, optional): Validate and default the CronJob on the server
+            without persisting it. Defaults to False.
+        bulk (bool, optional): One of many CronJobs being applied, ie: by an import.
+            Bulk applies and dry runs are rate limited like reads, rather than going
+            ahead of them. Defaults to False.
+        force (bool, optional): Take ownership of fields managed by others, ie: Helm.
+            Without it, such fields are a 409 conflict error. Defaults to True.
 
     Returns:
         dict: Returns the updated cronjob spec as a dict, or an error response
     """
     try:
-        name = spec["metadata"]["name"]
-        if get_cronjob(namespace, name):
-            cronjob = batch.patch_namespaced_cron_job(name, namespace, spec)
-        else:
-            cronjob = batch.create_namespaced_cron_job(namespace, spec)
+        spec = {"apiVersion": "batch/v1", "kind": "CronJob", **spec}
+        spec["metadata"] = {**spec["metadata"], "namespace": namespace}
+        query_params = [("fieldManager", "kronic")]
+        if force:
+            query_params.append(("force", "true"))
+        if dry_run:
+            query_params.append(("dryRun", "All"))
+
+        # The generated client can't send apply patches, so call the API directly
+        cronjob = _write(
+            generic.call_api,
+            "/apis/batch/v1/namespaces/{namespace}/cronjobs/{name}",
+            "PATCH",
+            path_params={"namespace": namespace, "name": spec["metadata"]["name"]},
+            query_params=query_params,
+            header_params={
+                "Accept": "application/json",
+                "Content-Type": "application/apply-patch+yaml",
+            },
+            body=spec,
+            response_type="V1CronJob",
+            auth_settings=["BearerToken"],
+            _return_http_data_only=True,
+            priority=not (dry_run or bulk),
+        )
         return _clean_api_object(cronjob)
 
     except ApiException as e:
@@ -412,7 +791,7 @@ def update_cronjob(namespace: str, spec: str) -> dict:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
@@ -430,7 +809,7 @@ def delete_cronjob(namespace: str, cronjob_name: str) -> dict:
         dict: Returns a dict of the deleted CronJob, or an error status
     """
     try:
-        deleted = batch.delete_namespaced_cron_job(cronjob_name, namespace)
+        deleted = _write(batch.delete_namespaced_cron_job, cronjob_name, namespace)
         return _clean_api_object(deleted)
 
     except ApiException as e:
@@ -440,7 +819,7 @@ def delete_cronjob(namespace: str, cronjob_name: str) -> dict:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
@@ -458,7 +837,7 @@ def delete_job(namespace: str, job_name: str) -> dict:
         str: Returns a dict of the deleted Job, or an error status
     """
     try:
-        deleted = batch.delete_namespaced_job(job_name, namespace)
+        deleted = _write(batch.delete_namespaced_job, job_name, namespace)
         return _clean_api_object(deleted)
 
     except ApiException as e:
@@ -468,7 +847,7 @@ def delete_job(namespace: str, job_name: str) -> dict:
             "exception": {
                 "status": e.status,
                 "reason": e.reason,
-                "message": e.body["message"],
+                "message": _error_message(e),
             },
         }
         return response
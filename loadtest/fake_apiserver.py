@@ -0,0 +1,363 @@
+"""A fake Kubernetes API server serving generated CronJobs, Jobs and Pods
+
+It implements just enough of the batch/v1 and core/v1 APIs for Kronic, with a
+configurable latency per request, and counts the calls it receives so a load test
+can measure how many upstream calls each Kronic request causes.
+
+Run standalone with `python loadtest/fake_apiserver.py --help`.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROUTES = [
+    (
+        "cronjobs",
+        re.compile(r"^/apis/batch/v1(?:/namespaces/(?P<ns>[^/]+))?/cronjobs$"),
+    ),
+    (
+        "cronjob",
+        re.compile(
+            r"^/apis/batch/v1/namespaces/(?P<ns>[^/]+)/cronjobs/(?P<name>[^/]+)(?P<status>/status)?$"
+        ),
+    ),
+    ("jobs", re.compile(r"^/apis/batch/v1(?:/namespaces/(?P<ns>[^/]+))?/jobs$")),
+    ("pods", re.compile(r"^/api/v1(?:/namespaces/(?P<ns>[^/]+))?/pods$")),
+    ("log", re.compile(r"^/api/v1/namespaces/(?P<ns>[^/]+)/pods/(?P<name>[^/]+)/log$")),
+]
+
+# Lines written to a followed log, and seconds between them
+FOLLOW_LINES = 60
+FOLLOW_INTERVAL = 5
+
+
+def _timestamp(minutes_ago: int) -> str:
+    when = datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeCluster:
+    """Generated objects, laid out as `namespaces` x `cronjobs` x `jobs` with one pod per job"""
+
+    def __init__(self, namespaces: int, cronjobs: int, jobs: int, log_lines: int):
+        self.namespaces = [f"ns-{i}" for i in range(namespaces)]
+        self.cronjobs = {}
+        self.jobs = {}
+        self.pods = {}
+        self.log = "".join(
+            f"{_timestamp(0)} line {i} of a fake job log\n" for i in range(log_lines)
+        ).encode()
+
+        for ns in self.namespaces:
+            self.cronjobs[ns] = [
+                self._cronjob(ns, f"cron-{i}") for i in range(cronjobs)
+            ]
+            self.jobs[ns] = []
+            self.pods[ns] = []
+            for cronjob in self.cronjobs[ns]:
+                for j in range(jobs):
+                    job = self._job(ns, cronjob["metadata"]["name"], j)
+                    self.jobs[ns].append(job)
+                    self.pods[ns].append(self._pod(ns, job["metadata"]["name"]))
+
+        # Serialize lists once, so the fake server stays cheap under load
+        self.lists = {}
+        for kind in ("cronjobs", "jobs", "pods"):
+            objects = getattr(self, kind)
+            for ns in self.namespaces:
+                self.lists[(kind, ns)] = self._list(objects[ns])
+            self.lists[(kind, None)] = self._list(
+                [item for ns in self.namespaces for item in objects[ns]]
+            )
+
+    @staticmethod
+    def _list(items: list) -> bytes:
+        return json.dumps(
+            {"metadata": {"resourceVersion": "1"}, "items": items}
+        ).encode()
+
+    @staticmethod
+    def _pod_template(name: str) -> dict:
+        return {
+            "spec": {
+                "containers": [
+                    {"name": name, "image": "busybox:latest", "command": ["date"]}
+                ],
+                "restartPolicy": "OnFailure",
+            }
+        }
+
+    def _cronjob(self, ns: str, name: str) -> dict:
+        return {
+            "apiVersion": "batch/v1",
+            "kind": "CronJob",
+            "metadata": {
+                "name": name,
+                "namespace": ns,
+                "uid": f"{ns}-{name}",
+                "resourceVersion": "1",
+                "labels": {"app": name},
+            },
+            "spec": {
+                "schedule": "*/10 * * * *",
+                "suspend": False,
+                "jobTemplate": {
+                    "metadata": {"name": name},
+                    "spec": {"template": self._pod_template(name)},
+                },
+            },
+            "status": {"lastScheduleTime": _timestamp(10)},
+        }
+
+    def _job(self, ns: str, cronjob: str, number: int) -> dict:
+        # The latest job of every fifth CronJob failed
+        failed = number == 0 and int(cronjob.rsplit("-", 1)[-1]) % 5 == 0
+        condition = {"type": "Failed" if failed else "Complete", "status": "True"}
+        return {
+            "apiVersion": "batch/v1",
+            "kind": "Job",
+            "metadata": {
+                "name": f"{cronjob}-{number}",
+                "namespace": ns,
+                "uid": f"{ns}-{cronjob}-{number}",
+                "resourceVersion": "1",
+                "labels": {"job-name": f"{cronjob}-{number}"},
+                "ownerReferences": [
+                    {
+                        "apiVersion": "batch/v1",
+                        "kind": "CronJob",
+                        "name": cronjob,
+                        "uid": f"{ns}-{cronjob}",
+                    }
+                ],
+            },
+            "spec": {"template": self._pod_template(cronjob)},
+            "status": {
+                "startTime": _timestamp(10 * (number + 1)),
+                "completionTime": None if failed else _timestamp(10 * number + 9),
+                "failed": 1 if failed else None,
+                "succeeded": None if failed else 1,
+                "conditions": [condition],
+            },
+        }
+
+    def _pod(self, ns: str, job: str) -> dict:
+        return {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {
+                "name": f"{job}-abcde",
+                "namespace": ns,
+                "uid": f"{ns}-{job}-abcde",
+                "labels": {"job-name": job},
+                "ownerReferences": [
+                    {"apiVersion": "batch/v1", "kind": "Job", "name": job, "uid": job}
+                ],
+            },
+            "spec": self._pod_template(job)["spec"],
+            "status": {"phase": "Succeeded", "startTime": _timestamp(10)},
+        }
+
+    def cronjob(self, ns: str, name: str) -> dict:
+        for cronjob in self.cronjobs.get(ns, []):
+            if cronjob["metadata"]["name"] == name:
+                return cronjob
+        return None
+
+
+class Stats:
+    """Thread-safe counts of API calls by route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def count(self, key: str):
+        with self._lock:
+            self.calls[key] += 1
+
+    def snapshot(self, reset: bool = False) -> dict:
+        with self._lock:
+            calls = dict(self.calls)
+            if reset:
+                self.calls.clear()
+        return calls
+
+
+def make_handler(cluster: FakeCluster, stats: Stats, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _not_found(self):
+            body = {
+                "kind": "Status",
+                "code": 404,
+                "reason": "NotFound",
+                "message": "not found",
+            }
+            self._send(404, json.dumps(body).encode())
+
+        def _watch(self, query: dict):
+            # Hold the watch open without events, like a quiet cluster
+            timeout = min(int(query.get("timeoutSeconds", ["30"])[0]), 30)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.flush()
+            time.sleep(timeout)
+            self.close_connection = True
+
+        def _follow(self):
+            # Send the log, then a line every few seconds like a running job
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                self._chunk(cluster.log)
+                for i in range(FOLLOW_LINES):
+                    time.sleep(FOLLOW_INTERVAL)
+                    self._chunk(f"{_timestamp(0)} followed line {i}\n".encode())
+                self._chunk(b"")
+            except OSError:
+                # Kronic closed the stream
+                pass
+            self.close_connection = True
+
+        def _chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def _route(self):
+            url = urlparse(self.path)
+            for route, pattern in ROUTES:
+                match = pattern.match(url.path)
+                if match:
+                    return route, match.groupdict(), parse_qs(url.query)
+            return None, {}, parse_qs(url.query)
+
+        def do_GET(self):
+            if self.path.startswith("/_stats"):
+                reset = "reset=true" in self.path
+                return self._send(200, json.dumps(stats.snapshot(reset)).encode())
+
+            route, params, query = self._route()
+            if query.get("watch", ["false"])[0].lower() == "true":
+                stats.count(f"WATCH {route}")
+                return self._watch(query)
+
+            stats.count(f"GET {route}")
+            time.sleep(latency)
+            ns = params.get("ns")
+            if route in ("cronjobs", "jobs", "pods"):
+                return self._send(
+                    200, cluster.lists.get((route, ns), cluster._list([]))
+                )
+            if route == "cronjob":
+                cronjob = cluster.cronjob(ns, params["name"])
+                if cronjob:
+                    return self._send(200, json.dumps(cronjob).encode())
+            if route == "log":
+                if query.get("follow", ["false"])[0].lower() == "true":
+                    return self._follow()
+                return self._send(200, cluster.log, "text/plain")
+            return self._not_found()
+
+        def do_POST(self):
+            route, params, query = self._route()
+            stats.count(f"POST {route}")
+            time.sleep(latency)
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body.setdefault("metadata", {})["uid"] = "created"
+            return self._send(201, json.dumps(body).encode())
+
+        def do_PATCH(self):
+            route, params, query = self._route()
+            stats.count(f"PATCH {route}")
+            time.sleep(latency)
+            self.rfile.read(int(self.headers["Content-Length"]))
+            cronjob = cluster.cronjob(params.get("ns"), params.get("name"))
+            if not cronjob:
+                return self._not_found()
+            return self._send(200, json.dumps(cronjob).encode())
+
+        def do_DELETE(self):
+            stats.count(f"DELETE {self._route()[0]}")
+            time.sleep(latency)
+            return self._not_found()
+
+    return Handler
+
+
+def serve(
+    port: int = 0,
+    namespaces: int = 10,
+    cronjobs: int = 50,
+    jobs: int = 3,
+    log_lines: int = 1000,
+    latency: float = 0.02,
+):
+    """Start the fake API server on a background thread
+
+    Returns:
+        tuple: The HTTPServer, whose `server_port` is the bound port, and its Stats
+    """
+    cluster = FakeCluster(namespaces, cronjobs, jobs, log_lines)
+    stats = Stats()
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), make_handler(cluster, stats, latency)
+    )
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-apiserver")
+    thread.daemon = True
+    thread.start()
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--namespaces", type=int, default=10)
+    parser.add_argument("--cronjobs", type=int, default=50, help="per namespace")
+    parser.add_argument("--jobs", type=int, default=3, help="per CronJob")
+    parser.add_argument("--log-lines", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    server, stats = serve(
+        args.port,
+        args.namespaces,
+        args.cronjobs,
+        args.jobs,
+        args.log_lines,
+        args.latency_ms / 1000,
+    )
+    print(f"Fake API server listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
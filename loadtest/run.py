@@ -0,0 +1,333 @@
+"""Replay a mix of Kronic traffic against gunicorn and a fake Kubernetes API server
+
+Starts the fake API server from `fake_apiserver.py`, runs Kronic under gunicorn
+against it, then sends requests at a fixed rate (an open loop, so a slow server
+builds up a backlog like it would with real users). Each endpoint is first loaded
+on its own, which attributes upstream API calls to it, followed by the whole mix.
+
+Reports throughput, latency percentiles and upstream calls per request for each
+endpoint, ie:
+
+    python loadtest/run.py --rps 50 --duration 20 --workers 4 --cronjobs 200
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_apiserver
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weights of each endpoint in the mixed phase
+DEFAULT_MIX = "index=2,namespace=2,getJobs=8,logs=3,trigger=1"
+
+KUBECONFIG = """apiVersion: v1
+kind: Config
+clusters:
+- name: fake
+  cluster:
+    server: http://127.0.0.1:{port}
+users:
+- name: fake
+  user:
+    token: fake
+contexts:
+- name: fake
+  context:
+    cluster: fake
+    user: fake
+current-context: fake
+"""
+
+
+def endpoint_request(endpoint: str, rng: random.Random, args) -> tuple:
+    """Return the method and path of a random request to an endpoint"""
+    ns = f"ns-{rng.randrange(args.namespaces)}"
+    cronjob = f"cron-{rng.randrange(args.cronjobs)}"
+    if endpoint == "index":
+        return "GET", "/"
+    if endpoint == "namespace":
+        return "GET", f"/namespaces/{ns}"
+    if endpoint == "getJobs":
+        return "GET", f"/api/namespaces/{ns}/cronjobs/{cronjob}/getJobs"
+    if endpoint == "logs":
+        pod = f"{cronjob}-{rng.randrange(args.jobs)}-abcde"
+        return "GET", f"/api/namespaces/{ns}/pods/{pod}/logs"
+    if endpoint == "trigger":
+        return "POST", f"/api/namespaces/{ns}/cronjobs/{cronjob}/trigger"
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def send(base_url: str, method: str, path: str, timeout: float) -> tuple:
+    """Send a request and return whether it succeeded and its latency in seconds"""
+    request = urllib.request.Request(
+        base_url + path,
+        method=method,
+        data=b"" if method == "POST" else None,
+        headers={"Content-Type": "application/json"},
+    )
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, time.monotonic() - started
+
+
+def run_phase(base_url: str, endpoints: dict, args) -> dict:
+    """Send requests at `args.rps` for `args.duration` seconds, picking endpoints by weight
+
+    Returns:
+        dict: endpoint -> list of (ok, latency) results
+    """
+    rng = random.Random(args.seed)
+    names = list(endpoints)
+    weights = [endpoints[name] for name in names]
+    results = {name: [] for name in names}
+    lock = threading.Lock()
+
+    def task(endpoint, method, path):
+        outcome = send(base_url, method, path, args.timeout)
+        with lock:
+            results[endpoint].append(outcome)
+
+    total = int(args.rps * args.duration)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i in range(total):
+            # Schedule against the start time, so slow responses don't lower the rate
+            delay = started + i / args.rps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = rng.choices(names, weights)[0]
+            executor.submit(task, endpoint, *endpoint_request(endpoint, rng, args))
+    results["_elapsed"] = time.monotonic() - started
+    return results
+
+
+class Followers:
+    """Follow pod logs in the background and keep the streams open, like idle browser tabs"""
+
+    def __init__(self, base_url: str, count: int, args):
+        self.base_url = base_url
+        self.count = count
+        self.args = args
+        self.open = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        rng = random.Random(self.args.seed)
+        for i in range(self.count):
+            pod = f"cron-{rng.randrange(self.args.cronjobs)}-0-abcde"
+            path = f"/api/namespaces/ns-{rng.randrange(self.args.namespaces)}/pods/{pod}/logs/follow"
+            thread = threading.Thread(target=self._follow, args=(path,), daemon=True)
+            thread.start()
+
+    def _follow(self, path: str):
+        opened = False
+        try:
+            with urllib.request.urlopen(
+                self.base_url + path, timeout=self.args.timeout
+            ) as response:
+                while not self._stop.is_set():
+                    if not response.read1(64 * 1024):
+                        break
+                    if not opened:
+                        opened = True
+                        with self._lock:
+                            self.open += 1
+        except (urllib.error.URLError, OSError):
+            with self._lock:
+                self.failed += 1
+        if opened:
+            with self._lock:
+                self.open -= 1
+
+    def stop(self):
+        self._stop.set()
+
+    def __str__(self):
+        return f"{self.open}/{self.count} followed logs open, {self.failed} failed"
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(title: str, results: dict, upstream_calls: int = None, followers=None):
+    elapsed = results.pop("_elapsed")
+    print(f"\n== {title} ({elapsed:.1f}s)" + (f", {followers}" if followers else ""))
+    print(
+        f"{'endpoint':<10} {'reqs':>6} {'errors':>6} {'rps':>7} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'upstream/req':>12}"
+    )
+    for endpoint, outcomes in results.items():
+        if not outcomes:
+            continue
+        latencies = [latency * 1000 for ok, latency in outcomes]
+        errors = sum(1 for ok, latency in outcomes if not ok)
+        amplification = ""
+        if upstream_calls is not None:
+            amplification = f"{upstream_calls / len(outcomes):.1f}"
+        print(
+            f"{endpoint:<10} {len(outcomes):>6} {errors:>6} {len(outcomes) / elapsed:>7.1f} "
+            f"{percentile(latencies, 50):>8.0f} {percentile(latencies, 95):>8.0f} "
+            f"{percentile(latencies, 99):>8.0f} {max(latencies):>8.0f} {amplification:>12}"
+        )
+
+
+def upstream_requests(calls: dict) -> int:
+    """Count API calls made on behalf of requests, ignoring background watches"""
+    return sum(count for call, count in calls.items() if not call.startswith("WATCH"))
+
+
+def start_kronic(args, kubeconfig_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "KUBECONFIG": kubeconfig_path,
+        "PYTHONUNBUFFERED": "1",
+    }
+    env.update(dict(item.split("=", 1) for item in args.env))
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "-w",
+        str(args.workers),
+        "-b",
+        f"127.0.0.1:{args.port}",
+        *args.gunicorn_arg,
+        "app:app",
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+
+def wait_until_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ok, latency = send(base_url, "GET", "/healthz", 1)
+        if ok:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"Kronic did not become ready at {base_url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rps", type=float, default=20, help="target requests/second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,...")
+    parser.add_argument(
+        "--mixed-only", action="store_true", help="skip per-endpoint phases"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument(
+        "--gunicorn-arg",
+        action="append",
+        default=[],
+        help="extra gunicorn argument, ie: --gunicorn-arg=--threads=8",
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        help="extra Kronic env, ie: KRONIC_API_QPS=0",
+    )
+    parser.add_argument(
+        "--followers",
+        type=int,
+        default=0,
+        help="followed pod logs to keep open throughout",
+    )
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--namespaces", type=int, default=10)
+    parser.add_argument("--cronjobs", type=int, default=50, help="per namespace")
+    parser.add_argument("--jobs", type=int, default=3, help="per CronJob")
+    parser.add_argument("--log-lines", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake API latency")
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="max open requests"
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mix = {}
+    for item in args.mix.split(","):
+        name, weight = item.split("=")
+        mix[name] = float(weight)
+
+    server, stats = fake_apiserver.serve(
+        0,
+        args.namespaces,
+        args.cronjobs,
+        args.jobs,
+        args.log_lines,
+        args.latency_ms / 1000,
+    )
+    print(
+        f"Fake API server on port {server.server_port} with "
+        f"{args.namespaces * args.cronjobs} CronJobs"
+    )
+
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as kubeconfig:
+        kubeconfig.write(KUBECONFIG.format(port=server.server_port))
+
+    kronic = start_kronic(args, kubeconfig.name)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_ready(base_url)
+        followers = None
+        if args.followers:
+            followers = Followers(base_url, args.followers, args)
+            followers.start()
+        # Let background caches finish their initial list before measuring
+        time.sleep(2)
+
+        if not args.mixed_only:
+            for endpoint in mix:
+                stats.snapshot(reset=True)
+                results = run_phase(base_url, {endpoint: 1}, args)
+                report(
+                    endpoint, results, upstream_requests(stats.snapshot()), followers
+                )
+
+        stats.snapshot(reset=True)
+        results = run_phase(base_url, mix, args)
+        calls = stats.snapshot()
+        report("mixed", results, followers=followers)
+        if followers:
+            followers.stop()
+        print("\nUpstream calls in mixed phase:")
+        for call, count in sorted(calls.items(), key=lambda item: -item[1]):
+            print(f"  {call:<20} {count:>8}")
+    finally:
+        kronic.terminate()
+        kronic.wait()
+        server.shutdown()
+        os.unlink(kubeconfig.name)
+
+
+if __name__ == "__main__":
+    main()
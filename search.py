@@ -0,0 +1,237 @@
+import re
+import threading
+
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Set, Tuple
+
+# Characters which separate the terms of an indexed value, eg: "repo/image:tag"
+TERM_SEPARATORS = re.compile(r"[\s/:@=,;'\"()\[\]{}|&<>$]+")
+# Whole values longer than this (ie: embedded scripts) are only indexed by their terms
+MAX_VALUE_LENGTH = 256
+# Fields which may be used to qualify a query, eg: "image:nginx"
+FIELDS = (
+    "name",
+    "namespace",
+    "label",
+    "image",
+    "command",
+    "env",
+    "secret",
+    "configmap",
+    "schedule",
+)
+
+Key = Tuple[str, str]
+
+
+def _trigrams(term: str) -> Set[str]:
+    return {term[i : i + 3] for i in range(len(term) - 2)}
+
+
+def _terms(value: str) -> Set[str]:
+    """Split a value into lowercased search terms, keeping short values whole as well"""
+    value = str(value).lower()
+    terms = {term for term in TERM_SEPARATORS.split(value) if term}
+    if len(value) <= MAX_VALUE_LENGTH:
+        terms.add(value)
+    return terms
+
+
+def cronjob_fields(cronjob: object) -> Dict[str, List[str]]:
+    """Extract the searchable values of a CronJob API object by field
+
+    Args:
+        cronjob (V1CronJob): A CronJob API object
+
+    Returns:
+        dict: field name -> list of values found in that field
+    """
+    fields = {field: [] for field in FIELDS}
+    fields["name"].append(cronjob.metadata.name)
+    fields["namespace"].append(cronjob.metadata.namespace)
+    for k, v in (cronjob.metadata.labels or {}).items():
+        fields["label"].extend([k, v, f"{k}={v}"])
+
+    spec = cronjob.spec
+    if not spec:
+        return fields
+    fields["schedule"].append(spec.schedule)
+
+    try:
+        pod_spec = spec.job_template.spec.template.spec
+    except AttributeError:
+        return fields
+    for volume in pod_spec.volumes or []:
+        if volume.secret:
+            fields["secret"].append(volume.secret.secret_name)
+        if volume.config_map:
+            fields["configmap"].append(volume.config_map.name)
+
+    for container in (pod_spec.init_containers or []) + (pod_spec.containers or []):
+        fields["image"].append(container.image)
+        fields["command"].extend((container.command or []) + (container.args or []))
+        for env in container.env or []:
+            fields["env"].append(env.name)
+            value_from = env.value_from
+            if value_from and value_from.secret_key_ref:
+                fields["secret"].append(value_from.secret_key_ref.name)
+            if value_from and value_from.config_map_key_ref:
+                fields["configmap"].append(value_from.config_map_key_ref.name)
+        for env_from in container.env_from or []:
+            if env_from.secret_ref:
+                fields["secret"].append(env_from.secret_ref.name)
+            if env_from.config_map_ref:
+                fields["configmap"].append(env_from.config_map_ref.name)
+
+    return fields
+
+
+class SearchIndex:
+    """An in-memory inverted index over CronJob specs, supporting prefix and substring queries
+
+    Each term points to the CronJobs and fields it was found in. Terms are additionally
+    indexed by their trigrams, so substring queries only check terms sharing every
+    trigram of the query instead of the whole vocabulary.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # term -> {(namespace, name): set of fields}
+        self._postings: Dict[str, Dict[Key, Set[str]]] = {}
+        # (namespace, name) -> set of terms, to un-index an object on update or delete
+        self._documents: Dict[Key, Set[str]] = {}
+        # trigram -> set of terms containing it
+        self._trigrams: Dict[str, Set[str]] = {}
+        # Sorted vocabulary for prefix queries shorter than a trigram, rebuilt lazily
+        self._vocabulary: List[str] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def update(self, cronjob: object):
+        """Index a CronJob API object, replacing any previous version of it"""
+        key = (cronjob.metadata.namespace, cronjob.metadata.name)
+        postings = {}
+        for field, values in cronjob_fields(cronjob).items():
+            for value in filter(None, values):
+                for term in _terms(value):
+                    postings.setdefault(term, set()).add(field)
+
+        with self._lock:
+            self.remove(*key)
+            for term, fields in postings.items():
+                if term not in self._postings:
+                    self._postings[term] = {}
+                    for trigram in _trigrams(term):
+                        self._trigrams.setdefault(trigram, set()).add(term)
+                    self._vocabulary = None
+                self._postings[term][key] = fields
+            self._documents[key] = set(postings)
+
+    def remove(self, namespace: str, name: str):
+        """Remove a CronJob from the index"""
+        key = (namespace, name)
+        with self._lock:
+            for term in self._documents.pop(key, ()):
+                documents = self._postings[term]
+                documents.pop(key, None)
+                if documents:
+                    continue
+                del self._postings[term]
+                for trigram in _trigrams(term):
+                    self._trigrams[trigram].discard(term)
+                    if not self._trigrams[trigram]:
+                        del self._trigrams[trigram]
+                self._vocabulary = None
+
+    def on_change(self, kind, event_type, namespace, name, api_object=None):
+        """A `ClusterState.subscribe` callback which keeps the index in step with CronJobs"""
+        if kind != "cronjob":
+            return
+        if event_type == "DELETED":
+            self.remove(namespace, name)
+        else:
+            self.update(api_object)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._trigrams.clear()
+            self._vocabulary = None
+
+    def _matching_terms(self, word: str) -> Iterator[str]:
+        """Yield indexed terms containing `word`, or starting with it when it is short"""
+        if len(word) >= 3:
+            trigram_sets = sorted(
+                (self._trigrams.get(trigram, set()) for trigram in _trigrams(word)),
+                key=len,
+            )
+            candidates = set.intersection(*trigram_sets) if trigram_sets else set()
+            yield from (term for term in candidates if word in term)
+            return
+
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        i = bisect_left(self._vocabulary, word)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(word):
+            yield self._vocabulary[i]
+            i += 1
+
+    def search(self, query: str, limit: int = 100) -> List[dict]:
+        """Find CronJobs matching every word of a query
+
+        Words match any indexed term containing them. A word may be qualified with
+        a field, ie: `image:nginx secret:db-creds`, to only match in that field.
+
+        Args:
+            query (str): Whitespace separated words
+            limit (int, optional): Maximum number of results. Defaults to 100.
+
+        Returns:
+            List of dicts: The namespace and name of each match, along with the
+                fields and terms which matched, sorted by namespace and name
+        """
+        words = []
+        for word in query.lower().split():
+            field, _, value = word.partition(":")
+            if value and field in FIELDS:
+                words.append((field, value))
+            else:
+                words.append((None, word))
+        if not words:
+            return []
+
+        with self._lock:
+            results = None
+            for field, word in words:
+                word_matches: Dict[Key, Dict[str, Set[str]]] = {}
+                for term in self._matching_terms(word):
+                    for key, fields in self._postings[term].items():
+                        for matched_field in fields:
+                            if field is None or field == matched_field:
+                                word_matches.setdefault(key, {}).setdefault(
+                                    matched_field, set()
+                                ).add(term)
+                if results is None:
+                    results = word_matches
+                else:
+                    results = {
+                        key: {
+                            f: results[key].get(f, set())
+                            | word_matches[key].get(f, set())
+                            for f in results[key].keys() | word_matches[key].keys()
+                        }
+                        for key in results.keys() & word_matches.keys()
+                    }
+                if not results:
+                    return []
+
+        return [
+            {
+                "namespace": namespace,
+                "name": name,
+                "matches": {f: sorted(terms) for f, terms in sorted(matches.items())},
+            }
+            for (namespace, name), matches in sorted(results.items())[:limit]
+        ]
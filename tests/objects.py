@@ -1,6 +1,6 @@
+from datetime import datetime, timedelta, timezone
 from kubernetes import client
 
-
 ## Create API Objects for testing
 
 labels = {"app": "test"}
@@ -42,3 +42,34 @@ def create_cronjob_list():
     return client.V1CronJobList(
         api_version="batch/v1", items=[create_cronjob(job) for job in jobs]
     )
+
+
+def create_owned_job(name, cronjob, state="running", minutes_ago=0, namespace="test"):
+    """Create a Job owned by `cronjob`, started `minutes_ago`
+
+    Args:
+        state (str): "running", "complete" (finished a minute after starting) or "failed"
+    """
+    job = create_job(name)
+    job.metadata.namespace = namespace
+    job.metadata.owner_references = [
+        client.V1OwnerReference(
+            api_version="batch/v1", kind="CronJob", name=cronjob, uid="1234"
+        )
+    ]
+    start = datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)
+    job.status = client.V1JobStatus(start_time=start)
+    if state == "running":
+        job.status.active = 1
+    elif state == "complete":
+        job.status.completion_time = start + timedelta(minutes=1)
+        job.status.succeeded = 1
+        job.status.conditions = [client.V1JobCondition(type="Complete", status="True")]
+    elif state == "failed":
+        job.status.failed = 1
+        job.status.conditions = [
+            client.V1JobCondition(
+                type="Failed", status="True", reason="BackoffLimitExceeded"
+            )
+        ]
+    return job
@@ -0,0 +1,344 @@
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
+import types
+import pytest
+import yaml
+
+from kubernetes.client.rest import ApiException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+import config
+
+config.TEST = True
+
+import app
+import clusters
+import kron
+import objects
+
+
+@pytest.fixture
+def client():
+    config.ALLOW_NAMESPACES = None
+    return app.app.test_client()
+
+
+@pytest.fixture
+def two_clusters(monkeypatch):
+    fake_clients = {"v1": None, "batch": None, "custom": None, "generic": None}
+    monkeypatch.setattr(config, "CLUSTERS", "east,west")
+    monkeypatch.setattr(
+        app,
+        "CLUSTERS",
+        {name: clusters.Cluster(name, fake_clients) for name in ("east", "west")},
+    )
+
+
+def test_unknown_cluster_is_not_found(client):
+    response = client.get("/api/search?q=test&cluster=missing")
+
+    assert response.status_code == 404
+    assert "missing" in response.json["exception"]["message"]
+
+
+def test_pages_carry_their_cluster(client, two_clusters):
+    client.set_cookie("kronic-cluster", "east")
+    html = client.get("/search?q=test&cluster=west").get_data(as_text=True)
+
+    assert "const clusterArg = '?cluster=west';" in html
+    assert '<input type="hidden" name="cluster" value="west" />' in html
+
+
+def failing_listing(pages_before_error):
+    """Replaces `iter_cronjobs` with a listing which fails after some pages"""
+
+    def iter_cronjobs(namespace):
+        for name in ["first", "second"][:pages_before_error]:
+            yield kron._clean_api_object(objects.create_cronjob(name))
+        raise ApiException(status=410, reason="Gone")
+
+    return iter_cronjobs
+
+
+def test_export_marks_an_incomplete_yaml(client, monkeypatch):
+    monkeypatch.setattr(app, "iter_cronjobs", failing_listing(2))
+    response = client.get("/api/namespaces/test/export")
+    documents = list(yaml.safe_load_all(response.get_data(as_text=True)))
+
+    assert response.status_code == 200
+    assert [document["metadata"]["name"] for document in documents[:2]] == [
+        "first",
+        "second",
+    ]
+    assert response.get_data(as_text=True).endswith(
+        "--- # ERROR: Export incomplete after 2 CronJobs: 410 Gone\n"
+    )
+
+
+def test_export_marks_an_incomplete_tar(client, monkeypatch):
+    monkeypatch.setattr(app, "iter_cronjobs", failing_listing(1))
+    response = client.get("/api/namespaces/test/export?format=tar")
+
+    with tarfile.open(fileobj=io.BytesIO(response.data)) as tar:
+        assert tar.getnames() == ["test/first.yaml", "test/ERROR"]
+        assert b"410 Gone" in tar.extractfile("test/ERROR").read()
+
+
+def test_export_fails_before_streaming(client, monkeypatch):
+    monkeypatch.setattr(app, "iter_cronjobs", failing_listing(0))
+    response = client.get("/api/namespaces/test/export")
+
+    assert response.status_code == 410
+
+
+@pytest.fixture
+def applied(monkeypatch):
+    """Replaces `update_cronjob`, recording the CronJobs applied and how many at once"""
+    applied = {
+        "cronjobs": [],
+        "dry_run": set(),
+        "bulk": set(),
+        "running": 0,
+        "max_running": 0,
+    }
+    lock = threading.Lock()
+
+    def update_cronjob(namespace, spec, dry_run=False, bulk=False):
+        with lock:
+            applied["running"] += 1
+            applied["max_running"] = max(applied["max_running"], applied["running"])
+        time.sleep(0.01)
+        with lock:
+            applied["running"] -= 1
+            applied["cronjobs"].append(spec)
+            applied["dry_run"].add(dry_run)
+            applied["bulk"].add(bulk)
+        if spec["metadata"]["name"] == "broken":
+            raise RuntimeError("connection reset")
+        return spec
+
+    monkeypatch.setattr(app, "update_cronjob", update_cronjob)
+    return applied
+
+
+def cronjob_yaml(*names, namespace="test"):
+    documents = []
+    for name in names:
+        cronjob = kron._clean_api_object(objects.create_cronjob(name))
+        cronjob["metadata"]["namespace"] = namespace
+        documents.append(yaml.safe_dump(cronjob))
+    return "---\n".join(documents)
+
+
+def import_lines(client, data, content_type="application/yaml", query=""):
+    response = client.post(
+        f"/api/namespaces/test/import{query}", data=data, content_type=content_type
+    )
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_import_yaml(client, applied):
+    lines = import_lines(client, cronjob_yaml("first", "second"))
+
+    assert sorted(line["name"] for line in lines[:-1]) == ["first", "second"]
+    assert {line["status"] for line in lines[:-1]} == {"applied"}
+    assert lines[-1] == {"summary": {"applied": 2, "failed": 0, "dryRun": False}}
+    # Imports wait for the rate limit, rather than going ahead of page loads
+    assert applied["bulk"] == {True}
+
+
+def test_import_ndjson_list(client, applied):
+    cronjobs = [
+        kron._clean_api_object(objects.create_cronjob(name)) for name in ("a", "b")
+    ]
+    data = json.dumps({"kind": "List", "items": cronjobs}) + "\n"
+    data += json.dumps(kron._clean_api_object(objects.create_cronjob("c"))) + "\n"
+    lines = import_lines(client, data, "application/x-ndjson")
+
+    assert sorted(line["name"] for line in lines[:-1]) == ["a", "b", "c"]
+    assert lines[-1]["summary"]["applied"] == 3
+
+
+def test_import_into_another_namespace(client, applied):
+    lines = import_lines(client, cronjob_yaml("first", namespace="elsewhere"))
+
+    assert lines[-1]["summary"]["applied"] == 1
+    assert applied["cronjobs"][0]["metadata"]["namespace"] == "test"
+
+
+def test_import_dry_run(client, applied):
+    lines = import_lines(client, cronjob_yaml("first"), query="?dryRun=true")
+
+    assert lines[0]["status"] == "validated"
+    assert lines[-1] == {"summary": {"validated": 1, "failed": 0, "dryRun": True}}
+    assert applied["dry_run"] == {True}
+
+
+def test_import_concurrency_is_bounded(client, applied, monkeypatch):
+    monkeypatch.setattr(config, "IMPORT_CONCURRENCY", 2)
+    names = [f"cronjob-{i}" for i in range(10)]
+    lines = import_lines(client, cronjob_yaml(*names))
+
+    assert lines[-1]["summary"]["applied"] == 10
+    assert applied["max_running"] == 2
+
+
+def test_import_reports_invalid_input_and_errors(client, applied):
+    data = cronjob_yaml("first", "broken") + "---\nmetadata: [unclosed\n"
+    lines = import_lines(client, data)
+
+    by_name = {line.get("name"): line for line in lines[:-1]}
+    assert by_name["first"]["status"] == "applied"
+    assert by_name["broken"] == {
+        "index": 1,
+        "name": "broken",
+        "status": "failed",
+        "message": "connection reset",
+    }
+    assert by_name[None]["message"].startswith("Invalid input")
+    assert lines[-1]["summary"] == {"applied": 1, "failed": 2, "dryRun": False}
+
+
+@pytest.fixture
+def editor(monkeypatch):
+    """Replaces the API calls of the CronJob editor with a live `first` CronJob"""
+    live = kron._clean_api_object(objects.create_cronjob("first"))
+    calls = []
+
+    def update_cronjob(namespace, spec, dry_run=False, bulk=False, force=True):
+        calls.append({"dry_run": dry_run, "force": force})
+        if spec["metadata"].get("labels", {}).get("conflict") and not force:
+            return {
+                "error": 500,
+                "exception": {
+                    "status": 409,
+                    "reason": "Conflict",
+                    "message": 'conflict with "helm": .spec.schedule',
+                },
+            }
+        return {**spec, "metadata": {**spec["metadata"], "namespace": namespace}}
+
+    def get_cronjob(namespace, name):
+        return live if name == "first" else False
+
+    monkeypatch.setattr(app, "update_cronjob", update_cronjob)
+    monkeypatch.setattr(app, "get_cronjob", get_cronjob)
+    return {"live": live, "calls": calls}
+
+
+def submit(client, cronjob, action="apply", name="first"):
+    data = cronjob if isinstance(cronjob, str) else yaml.safe_dump(cronjob)
+    return client.post(
+        f"/namespaces/test/cronjobs/{name}", data={"yaml": data, "action": action}
+    )
+
+
+@pytest.mark.parametrize(
+    "submitted, error",
+    [
+        ("metadata: [unclosed", "Invalid YAML"),
+        ("kind: Deployment\nmetadata:\n  name: first\n", "Expected kind CronJob"),
+        (
+            "metadata:\n  name: first\n  namespace: other\nspec: {}\n",
+            "metadata.namespace must be test",
+        ),
+        ("metadata:\n  name: first\n", "spec is required"),
+    ],
+)
+def test_editor_rejects_invalid_cronjobs(client, editor, submitted, error):
+    html = submit(client, submitted).get_data(as_text=True)
+
+    assert "Not applied:" in html
+    assert error in html
+    assert editor["calls"] == []
+
+
+def test_editor_preview_shows_changes(client, editor):
+    edited = yaml.safe_load(yaml.safe_dump(editor["live"]))
+    edited["spec"]["schedule"] = "*/5 * * * *"
+    html = submit(client, edited, "preview").get_data(as_text=True)
+
+    assert "the server accepted these changes" in html
+    assert "<code>spec.schedule</code>" in html
+    assert "Conflicts:" not in html
+    assert editor["calls"] == [{"dry_run": True, "force": False}]
+
+
+def test_editor_preview_of_a_new_cronjob(client, editor):
+    edited = yaml.safe_load(yaml.safe_dump(editor["live"]))
+    edited["metadata"]["name"] = "second"
+    html = submit(client, edited, "preview").get_data(as_text=True)
+
+    assert "this will create a new CronJob" in html
+
+
+def test_editor_preview_shows_conflicts(client, editor):
+    edited = yaml.safe_load(yaml.safe_dump(editor["live"]))
+    edited["metadata"]["labels"] = {"conflict": "true"}
+    html = submit(client, edited, "preview").get_data(as_text=True)
+
+    assert "Conflicts:" in html
+    assert "conflict with &#34;helm&#34;: .spec.schedule" in html
+    assert "<code>metadata.labels.conflict</code>" in html
+    assert editor["calls"] == [
+        {"dry_run": True, "force": False},
+        {"dry_run": True, "force": True},
+    ]
+
+
+def test_editor_redirects_to_a_renamed_cronjob(client, editor):
+    edited = yaml.safe_load(yaml.safe_dump(editor["live"]))
+    edited["metadata"]["name"] = "second"
+    response = submit(client, edited)
+
+    assert response.status_code == 302
+    assert response.location == "/namespaces/test/cronjobs/second"
+    assert editor["calls"] == [{"dry_run": False, "force": True}]
+
+
+def sync(cluster):
+    """Mark a cluster's job cache as having finished its initial list"""
+    synced = threading.Event()
+    synced.set()
+    cluster.state.reflectors = [types.SimpleNamespace(synced=synced)]
+
+
+def test_failing_reports_syncing_clusters(client, two_clusters):
+    east = app.CLUSTERS["east"]
+    sync(east)
+    east.state.replace("cronjob", None, objects.create_cronjob_list().items)
+    east.state.apply(
+        "job", "ADDED", objects.create_owned_job("first-1", "first", "failed")
+    )
+
+    response = client.get("/api/failing")
+
+    assert response.status_code == 200
+    assert [(job["cluster"], job["job"]) for job in response.json["jobs"]] == [
+        ("east", "first-1")
+    ]
+    assert response.json["ready"] == {"east": True, "west": False}
+    assert response.json["errors"] == {"west": "The job cache has not finished syncing"}
+    html = client.get("/failing").get_data(as_text=True)
+    assert "The job cache of west is still syncing" in html
+
+
+def test_failing_is_unavailable_until_a_cluster_is_synced(client, two_clusters):
+    assert client.get("/api/failing").status_code == 503
+
+    for cluster in app.CLUSTERS.values():
+        sync(cluster)
+    response = client.get("/api/failing")
+    assert response.json == {
+        "jobs": [],
+        "ready": {"east": True, "west": True},
+        "errors": {},
+    }
@@ -0,0 +1,183 @@
+import os
+import shutil
+import sys
+import pytest
+
+from kubernetes import client
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+import config
+
+config.TEST = True
+
+import archive
+import objects
+
+
+class FakeLogResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, amt):
+        for i in range(0, len(self.data), amt):
+            yield self.data[i : i + amt]
+
+    def release_conn(self):
+        pass
+
+
+class FakeCoreApi:
+    """Serves a single succeeded pod whose logs are `lines`"""
+
+    def __init__(self, lines):
+        self.logs = "".join(f"{line}\n" for line in lines).encode()
+
+    def list_namespaced_pod(self, namespace, label_selector):
+        pod = client.V1Pod(
+            metadata=client.V1ObjectMeta(name="first-1-abcde", namespace=namespace),
+            spec=objects.create_pod_spec().spec,
+            status=client.V1PodStatus(phase="Succeeded"),
+        )
+        return client.V1PodList(items=[pod])
+
+    def read_namespaced_pod_log(self, name, namespace, **kwargs):
+        return FakeLogResponse(self.logs)
+
+
+@pytest.fixture
+def log_archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "CHUNK_SIZE", 1024)
+    lines = [f"2024-01-01T00:00:00Z processing record {i}" for i in range(200)]
+    lines[150] = "2024-01-01T00:00:00Z ERROR database connection refused"
+    log_archive = archive.LogArchive(str(tmp_path), FakeCoreApi(lines))
+    log_archive.archive_job(objects.create_owned_job("first-1", "first", "complete"))
+    return log_archive
+
+
+def test_bloom_filter():
+    bloom = archive.build_bloom(archive._trigrams(b"hello world"))
+    assert archive.bloom_may_contain(bloom, b"WORLD")
+    assert not archive.bloom_may_contain(bloom, b"kubernetes")
+    assert archive.bloom_may_contain(bloom, b"zz")
+
+
+def test_archive_job_is_chunked_and_indexed(log_archive):
+    [entry] = log_archive.find("test", cronjob="first")
+    assert entry["job"] == "first-1"
+    assert entry["container"] == "test"
+    assert len(entry["chunks"]) > 1
+    assert sum(chunk["lines"] for chunk in entry["chunks"]) == 200
+
+
+def test_archive_job_only_once(log_archive):
+    log_archive.archive_job(objects.create_owned_job("first-1", "first", "complete"))
+    assert len(log_archive.entries()) == 1
+
+
+def test_search_only_reads_matching_chunks(log_archive, monkeypatch):
+    opened = []
+    gzip_open = archive.gzip.open
+    monkeypatch.setattr(
+        archive.gzip,
+        "open",
+        lambda path, mode: opened.append(path) or gzip_open(path, mode),
+    )
+
+    assert list(log_archive.search("connection REFUSED", "test")) == [
+        "[pod/first-1-abcde/test] 2024-01-01T00:00:00Z ERROR database connection refused\n"
+    ]
+    assert len(opened) == 1
+
+
+def test_search_is_bounded(log_archive):
+    lines = list(log_archive.search("record", "test", max_matches=5))
+    assert len(lines) == 5
+
+    lines = list(log_archive.search("record", "test", max_bytes=2048))
+    assert lines[-1].startswith("Kronic> Search stopped")
+
+
+def test_read_archived_pod(log_archive):
+    assert len(list(log_archive.read("test", "first-1-abcde"))) == 200
+
+
+def archive_expiring_job(log_archive):
+    """Archive a two day old run, then shorten the retention to a day"""
+    log_archive.archive_job(
+        objects.create_owned_job(
+            "first-0", "first", "complete", minutes_ago=2 * 24 * 60
+        )
+    )
+    log_archive.retention = 24 * 60 * 60
+
+
+def test_prune_expired_runs(log_archive):
+    archive_expiring_job(log_archive)
+    assert len(log_archive.entries()) == 2
+
+    log_archive.prune()
+    assert [entry["job"] for entry in log_archive.entries()] == ["first-1"]
+    assert not os.path.exists(os.path.join(log_archive.root, "test", "first-0"))
+
+
+def test_prune_by_another_process_is_detected(log_archive):
+    other = archive.LogArchive(log_archive.root, log_archive.core)
+    archive_expiring_job(log_archive)
+    assert len(other.entries()) == 2
+
+    log_archive.prune()
+    entry = log_archive.entries()[0]
+    for i in range(5):
+        log_archive._append_index({**entry, "job": f"first-{i + 2}"})
+
+    assert other.entries() == log_archive.entries()
+    assert len(other.entries()) == 6
+
+
+def test_pruned_chunks_are_skipped(log_archive):
+    shutil.rmtree(os.path.join(log_archive.root, "test", "first-1"))
+
+    assert list(log_archive.search("error", "test")) == []
+    assert list(log_archive.read("test", "first-1-abcde")) == []
+
+
+def test_archive_waits_for_the_rate_limit(tmp_path):
+    calls = []
+    log_archive = archive.LogArchive(
+        str(tmp_path), FakeCoreApi(["line"]), throttle=lambda: calls.append(1)
+    )
+    log_archive.archive_job(objects.create_owned_job("first-1", "first", "complete"))
+
+    # One pod LIST and one log read of its single container
+    assert len(calls) == 2
+
+
+def test_jobs_past_retention_are_not_archived(log_archive):
+    log_archive.archive_job(
+        objects.create_owned_job(
+            "first-0", "first", "complete", minutes_ago=8 * 24 * 60
+        )
+    )
+
+    assert [entry["job"] for entry in log_archive.entries()] == ["first-1"]
+    assert not os.path.exists(os.path.join(log_archive.root, "test", "first-0"))
+
+
+def test_job_without_finished_pods_is_unclaimed(tmp_path):
+    class NoPodsCoreApi(FakeCoreApi):
+        def list_namespaced_pod(self, namespace, label_selector):
+            return client.V1PodList(items=[])
+
+    log_archive = archive.LogArchive(str(tmp_path), NoPodsCoreApi([]))
+    job = objects.create_owned_job("first-1", "first", "complete")
+    log_archive.archive_job(job)
+
+    assert log_archive.entries() == []
+    assert not os.path.exists(os.path.join(log_archive.root, "test", "first-1"))
+
+    # Archived once its pods have finished
+    log_archive.core = FakeCoreApi(["line"])
+    log_archive.archive_job(job)
+    assert [entry["job"] for entry in log_archive.entries()] == ["first-1"]
@@ -0,0 +1,219 @@
+import os
+import sys
+import pytest
+import threading
+import time
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+import config
+
+config.TEST = True
+
+import cache
+import objects
+
+
+@pytest.fixture
+def state():
+    config.ALLOW_NAMESPACES = None
+    state = cache.ClusterState(batch_api=None)
+    state.replace("cronjob", None, objects.create_cronjob_list().items)
+    return state
+
+
+def test_namespace_summary_counts(state):
+    suspended = objects.create_cronjob("sixth")
+    suspended.spec.suspend = True
+    state.apply("cronjob", "ADDED", suspended)
+
+    assert state.namespace_summary() == {
+        "test": {"cronjobs": 6, "suspended": 1, "failing": 0}
+    }
+
+
+def test_latest_failed_job_marks_cronjob_failing(state):
+    state.apply(
+        "job",
+        "ADDED",
+        objects.create_owned_job("first-1", "first", "complete", minutes_ago=5),
+    )
+    state.apply("job", "ADDED", objects.create_owned_job("first-2", "first", "failed"))
+
+    assert state.namespace_summary()["test"]["failing"] == 1
+    assert (
+        state.failing[("test", "first")]["failure"]["reason"] == "BackoffLimitExceeded"
+    )
+
+
+def test_newer_successful_job_clears_failure(state):
+    state.apply(
+        "job",
+        "ADDED",
+        objects.create_owned_job("first-1", "first", "failed", minutes_ago=5),
+    )
+    state.apply(
+        "job", "ADDED", objects.create_owned_job("first-2", "first", "complete")
+    )
+
+    assert state.namespace_summary()["test"]["failing"] == 0
+
+
+def test_deleting_failed_job_clears_failure(state):
+    state.apply("job", "ADDED", objects.create_owned_job("first-1", "first", "failed"))
+    state.apply(
+        "job", "DELETED", objects.create_owned_job("first-1", "first", "failed")
+    )
+
+    assert ("test", "first") not in state.failing
+    assert state.jobs == {}
+
+
+def test_replace_removes_stale_objects(state):
+    state.replace("cronjob", "test", objects.create_cronjob_list().items[:2])
+
+    assert state.namespace_summary()["test"]["cronjobs"] == 2
+
+
+def test_failing_jobs_lists_latest_failure(state):
+    state.apply("job", "ADDED", objects.create_owned_job("first-1", "first", "failed"))
+    state.apply(
+        "job",
+        "ADDED",
+        objects.create_owned_job("orphan-1", "deleted-cronjob", "failed"),
+    )
+
+    failing = state.failing_jobs()
+    assert [job["job"] for job in failing] == ["first-1"]
+    assert failing[0]["cronjob"] == "first"
+    assert failing[0]["reason"] == "BackoffLimitExceeded"
+
+
+def oom_killed_pod():
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name="first-1-abcde"),
+        status=client.V1PodStatus(
+            container_statuses=[
+                client.V1ContainerStatus(
+                    name="test",
+                    image="busybox",
+                    image_id="",
+                    ready=False,
+                    restart_count=0,
+                    state=client.V1ContainerState(
+                        terminated=client.V1ContainerStateTerminated(
+                            exit_code=137, reason="OOMKilled"
+                        )
+                    ),
+                )
+            ]
+        ),
+    )
+
+
+def test_pod_exit_code():
+    assert cache._pod_exit_code(oom_killed_pod()) == {
+        "pod": "first-1-abcde",
+        "exitCode": 137,
+        "exitReason": "OOMKilled",
+    }
+
+
+class FlakyCoreApi:
+    """Fails `failures` pod LISTs, then serves a pod which was OOM killed"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def list_namespaced_pod(self, namespace, label_selector):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ApiException(status=500, reason="Internal Server Error")
+        return client.V1PodList(items=[oom_killed_pod()])
+
+
+def collect_exit_code(monkeypatch, core):
+    monkeypatch.setattr(cache, "MAX_BACKOFF", 0)
+    monkeypatch.setattr(cache, "EXIT_CODE_ATTEMPTS", 3)
+    state = cache.ClusterState(batch_api=None, core_api=core)
+    state.replace("cronjob", None, objects.create_cronjob_list().items)
+    thread = threading.Thread(target=state._collect_exit_codes, daemon=True)
+    thread.start()
+    state.apply("job", "ADDED", objects.create_owned_job("first-1", "first", "failed"))
+    for _ in range(100):
+        failure = state.jobs[("test", "first-1")]["failure"]
+        if "exitCode" in failure:
+            break
+        time.sleep(0.01)
+    state.stop()
+    return failure
+
+
+def test_exit_code_lookup_is_retried(monkeypatch):
+    failure = collect_exit_code(monkeypatch, FlakyCoreApi(failures=2))
+
+    assert failure["exitCode"] == 137
+
+
+def test_exit_code_lookup_gives_up(monkeypatch):
+    core = FlakyCoreApi(failures=10)
+    failure = collect_exit_code(monkeypatch, core)
+
+    assert failure["exitCode"] is None
+    assert core.calls == 3
+
+
+def test_reflector_waits_for_the_rate_limit(state):
+    calls = []
+
+    def list_func(**kwargs):
+        calls.append(("list", kwargs))
+        return client.V1CronJobList(
+            metadata=client.V1ListMeta(resource_version="1"), items=[]
+        )
+
+    reflector = cache.Reflector(
+        "cronjobs",
+        list_func,
+        state,
+        "cronjob",
+        lambda: calls.append("throttle"),
+        namespace="test",
+    )
+
+    assert reflector._list() == "1"
+    assert calls == ["throttle", ("list", {"namespace": "test"})]
+
+
+def test_replace_yields_between_batches(state, monkeypatch):
+    unlocked = []
+
+    def sleep(seconds):
+        # Other threads can read the store while replace yields
+        reader = threading.Thread(
+            target=lambda: unlocked.append(state.namespace_summary() is not None)
+        )
+        reader.start()
+        reader.join(timeout=1)
+        unlocked.append(not reader.is_alive())
+
+    monkeypatch.setattr(cache, "REPLACE_BATCH", 2)
+    monkeypatch.setattr(cache.time, "sleep", sleep)
+    jobs = [objects.create_owned_job(f"first-{i}", "first") for i in range(5)]
+
+    state.replace("job", None, jobs)
+
+    assert unlocked == [True, True, True, True]
+    assert len(state.jobs) == 5
+
+
+def test_run_blocking_uses_a_real_thread_on_gevent(monkeypatch):
+    assert cache.run_blocking(threading.get_native_id) == threading.get_native_id()
+
+    monkeypatch.setattr(cache, "_on_gevent", lambda: True)
+    assert cache.run_blocking(threading.get_native_id) != threading.get_native_id()
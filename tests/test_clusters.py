@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+import config
+
+config.TEST = True
+
+import clusters
+import kron
+
+
+def fake_cluster(name):
+    return clusters.Cluster(name, {"v1": name, "batch": name, "generic": name})
+
+
+def test_fan_out_selects_each_cluster_clients():
+    results, errors = clusters.fan_out(
+        lambda cluster: kron.batch.upper(), [fake_cluster("east"), fake_cluster("west")]
+    )
+
+    assert results == {"east": "EAST", "west": "WEST"}
+    assert errors == {}
+
+
+def test_fan_out_reports_slow_and_failing_clusters():
+    def call(cluster):
+        if cluster.name == "slow":
+            time.sleep(2)
+        if cluster.name == "broken":
+            raise ValueError("connection refused")
+        return cluster.name
+
+    started = time.time()
+    results, errors = clusters.fan_out(
+        call,
+        [fake_cluster("ok"), fake_cluster("slow"), fake_cluster("broken")],
+        timeout=0.5,
+    )
+
+    assert time.time() - started < 1.5
+    assert results == {"ok": "ok"}
+    assert errors == {"slow": "No response within 0.5s", "broken": "connection refused"}
+
+
+def test_fan_out_times_out_api_calls():
+    def call(cluster):
+        return kron._read(lambda **kwargs: kwargs)
+
+    results, errors = clusters.fan_out(call, [fake_cluster("east")], timeout=2)
+
+    assert results == {"east": {"_request_timeout": 2}}
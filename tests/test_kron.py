@@ -1,8 +1,11 @@
 import os
 import sys
+import threading
+import time
 import pytest
 
 from datetime import datetime, timedelta, timezone
+from kubernetes import client
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -26,32 +29,6 @@ def past_timestamp():
     return (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
 
 
-# Define a fixture to create a timestamp in the future
-@pytest.fixture
-def future_timestamp():
-    return (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
-
-
-def test_get_human_readable_time_difference_past(past_timestamp):
-    result = kron._get_time_since(past_timestamp)
-    assert "d" in result  # Check if the result contains 'd' for days
-
-
-def test_get_human_readable_time_difference_future(future_timestamp):
-    result = kron._get_time_since(future_timestamp)
-    assert result == "In the future"  # Check if the result is "In the future"
-
-
-def test_get_human_readable_time_difference_now():
-    result = kron._get_time_since(datetime.now(timezone.utc).isoformat())
-    assert result == "0s"  # Check if the result is "0s" for the current time
-
-
-def test_get_human_readable_time_difference_invalid_format():
-    with pytest.raises(ValueError):
-        kron._get_time_since("invalid_timestamp")
-
-
 def test_filter_dict_fields():
     cron_dict_list = [
         {"metadata": {"name": "first", "namespace": "test"}},
@@ -107,3 +84,228 @@ def test_namespace_filter_allows_access(namespace: str = "test"):
 
     result = to_be_decorated(namespace)
     assert result is True
+
+
+def test_diff_objects():
+    live = {
+        "metadata": {"name": "test", "labels": {"app": "test"}},
+        "spec": {"schedule": "* * * * *", "args": ["a", "b"]},
+    }
+    edited = {
+        "metadata": {"name": "test"},
+        "spec": {"schedule": "*/5 * * * *", "args": ["a", "b", "c"], "suspend": True},
+    }
+
+    assert kron.diff_objects(live, edited) == [
+        {
+            "path": "metadata.labels",
+            "op": "removed",
+            "old": {"app": "test"},
+            "new": None,
+        },
+        {"path": "spec.args[2]", "op": "added", "old": None, "new": "c"},
+        {
+            "path": "spec.schedule",
+            "op": "changed",
+            "old": "* * * * *",
+            "new": "*/5 * * * *",
+        },
+        {"path": "spec.suspend", "op": "added", "old": None, "new": True},
+    ]
+    assert kron.diff_objects(live, live) == []
+
+
+def test_iter_cronjobs_pages(cronjob_list):
+    config.ALLOW_NAMESPACES = None
+    calls = []
+
+    class FakeBatch:
+        def list_namespaced_cron_job(self, namespace, limit, _continue):
+            calls.append(_continue)
+            start = int(_continue or 0)
+            end = start + limit
+            return client.V1CronJobList(
+                items=cronjob_list.items[start:end],
+                metadata=client.V1ListMeta(
+                    _continue=str(end) if end < len(cronjob_list.items) else None
+                ),
+            )
+
+    token = kron.select_clients({**kron.default_clients, "batch": FakeBatch()})
+    try:
+        names = [
+            cronjob["metadata"]["name"] for cronjob in kron.iter_cronjobs("test", 2)
+        ]
+    finally:
+        kron.reset_clients(token)
+
+    assert names == ["first", "second", "third", "fourth", "fifth"]
+    assert calls == [None, "2", "4"]
+
+
+def test_stream_pod_logs_decodes_split_characters():
+    released = []
+
+    class FakeResponse:
+        def stream(self, amt):
+            # "é" split across two chunks
+            yield b"line 1 caf\xc3"
+            yield b"\xa9\nline 2\n"
+
+        def release_conn(self):
+            released.append(True)
+
+    class FakeV1:
+        def read_namespaced_pod_log(self, name, namespace, **kwargs):
+            assert kwargs["follow"] and not kwargs["_preload_content"]
+            return FakeResponse()
+
+    token = kron.select_clients({**kron.default_clients, "v1": FakeV1()})
+    try:
+        logs = "".join(kron.stream_pod_logs("test", "pod"))
+    finally:
+        kron.reset_clients(token)
+
+    assert logs == "line 1 caf\u00e9\nline 2\n"
+    assert released == [True]
+
+
+def test_set_ages(past_timestamp):
+    now = kron._parse_timestamp(past_timestamp) + 90
+    items = [
+        {"status": {"startTime": past_timestamp}},
+        {"status": {"startTime": past_timestamp, "completionTime": past_timestamp}},
+        {"status": {"phase": "Pending"}},
+    ]
+
+    kron._set_ages(items, now)
+
+    assert [item["status"]["ageSeconds"] for item in items] == [90, 90, None]
+    assert [item["status"]["durationSeconds"] for item in items] == [None, 0, None]
+
+
+def test_single_flight_shares_concurrent_calls():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_list():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return ["result"]
+
+    flight = kron._SingleFlight()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("key", slow_list)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [["result"]] * 5
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_token_bucket_prioritizes_writes():
+    bucket = kron._TokenBucket(rate=10, burst=1)
+    bucket.acquire()
+
+    started = time.monotonic()
+    bucket.acquire(priority=True)
+    assert time.monotonic() - started < 0.05
+
+    bucket.acquire()
+    # The write went into debt, so this read waits for two tokens
+    assert time.monotonic() - started >= 0.15
+
+
+def test_throttle_limits_each_cluster(monkeypatch):
+    monkeypatch.setattr(config, "API_QPS", 10)
+    monkeypatch.setattr(config, "API_BURST", 1)
+    monkeypatch.setattr(kron, "_rate_limiters", {})
+    east, west = {"name": "east"}, {"name": "west"}
+
+    started = time.monotonic()
+    kron.throttle(east)
+    kron.throttle(west)
+    assert time.monotonic() - started < 0.05
+
+    kron.throttle(east)
+    assert time.monotonic() - started >= 0.08
+
+
+def test_token_bucket_caps_write_debt():
+    bucket = kron._TokenBucket(rate=1000, burst=5)
+
+    started = time.monotonic()
+    for _ in range(100):
+        bucket.acquire(priority=True)
+    # Past the debt cap, writes are rate limited too
+    assert time.monotonic() - started >= 0.08
+    assert bucket.tokens >= -5
+
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started < 0.05
+
+
+class FakeGeneric:
+    """Records `call_api` requests and answers them with the applied CronJob"""
+
+    def __init__(self):
+        self.requests = []
+
+    def call_api(self, path, method, **kwargs):
+        self.requests.append((path, method, kwargs))
+        return objects.create_cronjob(kwargs["body"]["metadata"]["name"])
+
+    def sanitize_for_serialization(self, api_object):
+        return kron.default_clients["generic"].sanitize_for_serialization(api_object)
+
+
+@pytest.mark.parametrize(
+    "options, query",
+    [
+        ({}, [("fieldManager", "kronic"), ("force", "true")]),
+        (
+            {"dry_run": True},
+            [("fieldManager", "kronic"), ("force", "true"), ("dryRun", "All")],
+        ),
+        (
+            {"dry_run": True, "force": False},
+            [("fieldManager", "kronic"), ("dryRun", "All")],
+        ),
+    ],
+)
+def test_update_cronjob_server_side_applies(options, query):
+    generic = FakeGeneric()
+    token = kron.select_clients({**kron.default_clients, "generic": generic})
+    try:
+        cronjob = kron.update_cronjob(
+            "test", {"metadata": {"name": "first"}, "spec": {}}, **options
+        )
+    finally:
+        kron.reset_clients(token)
+
+    [(path, method, kwargs)] = generic.requests
+    assert path == "/apis/batch/v1/namespaces/{namespace}/cronjobs/{name}"
+    assert method == "PATCH"
+    assert kwargs["path_params"] == {"namespace": "test", "name": "first"}
+    assert kwargs["query_params"] == query
+    assert kwargs["header_params"]["Content-Type"] == "application/apply-patch+yaml"
+    assert kwargs["body"] == {
+        "apiVersion": "batch/v1",
+        "kind": "CronJob",
+        "metadata": {"name": "first", "namespace": "test"},
+        "spec": {},
+    }
+    assert cronjob["metadata"]["name"] == "first"
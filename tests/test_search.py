@@ -0,0 +1,85 @@
+import os
+import sys
+import pytest
+
+from kubernetes import client
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+import config
+
+config.TEST = True
+
+import objects
+import search
+
+
+@pytest.fixture
+def index():
+    index = search.SearchIndex()
+    for cronjob in objects.create_cronjob_list().items:
+        index.update(cronjob)
+
+    backup = objects.create_cronjob("db-backup")
+    container = backup.spec.job_template.spec.template.spec.containers[0]
+    container.image = "registry.example.com/tools/pg-dump:16"
+    container.command = ["/bin/sh", "-c", "pg_dump --all > /backup/db.sql"]
+    container.env = [
+        client.V1EnvVar(
+            name="PGPASSWORD",
+            value_from=client.V1EnvVarSource(
+                secret_key_ref=client.V1SecretKeySelector(
+                    name="db-credentials", key="password"
+                )
+            ),
+        )
+    ]
+    index.update(backup)
+    return index
+
+
+def names(results):
+    return [result["name"] for result in results]
+
+
+def test_search_by_image_substring(index):
+    assert names(index.search("pg-du")) == ["db-backup"]
+    assert names(index.search("busybox")) == [
+        "fifth",
+        "first",
+        "fourth",
+        "second",
+        "third",
+    ]
+
+
+def test_search_short_prefix(index):
+    assert names(index.search("fi")) == ["fifth", "first"]
+
+
+def test_search_field_qualified(index):
+    assert names(index.search("secret:db-cred")) == ["db-backup"]
+    assert names(index.search("env:pgpassword")) == ["db-backup"]
+    assert index.search("image:db-cred") == []
+
+
+def test_search_requires_every_word(index):
+    assert names(index.search("db pg_dump")) == ["db-backup"]
+    assert index.search("first pg_dump") == []
+
+
+def test_search_reports_matches(index):
+    result = index.search("PGPASS")[0]
+    assert result["namespace"] == "test"
+    assert result["matches"] == {"env": ["pgpassword"]}
+
+
+def test_update_and_remove(index):
+    replaced = objects.create_cronjob("db-backup")
+    index.update(replaced)
+    assert index.search("pg-dump") == []
+
+    index.on_change("cronjob", "DELETED", "test", "db-backup")
+    assert index.search("db-backup") == []
+    assert len(index) == 5
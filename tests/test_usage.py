@@ -0,0 +1,151 @@
+import os
+import sys
+import pytest
+
+from kubernetes.client.rest import ApiException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+import config
+
+config.TEST = True
+
+import cache
+import objects
+import usage
+
+
+def pod_metrics(pod, job, cpu, memory):
+    return {
+        "metadata": {"name": pod, "namespace": "test", "labels": {"job-name": job}},
+        "containers": [{"name": "test", "usage": {"cpu": cpu, "memory": memory}}],
+    }
+
+
+class FakeMetricsApi:
+    def __init__(self):
+        self.items = []
+        self.calls = []
+
+    def list_namespaced_custom_object(
+        self, group, version, namespace, plural, **kwargs
+    ):
+        self.calls.append((group, version, namespace, plural, kwargs["label_selector"]))
+        return {"items": self.items}
+
+
+@pytest.fixture
+def state():
+    config.ALLOW_NAMESPACES = None
+    return cache.ClusterState(batch_api=None)
+
+
+def test_collect_lists_each_namespace_once(state):
+    state.apply("job", "ADDED", objects.create_owned_job("first-1", "first"))
+    state.apply("job", "ADDED", objects.create_owned_job("second-1", "second"))
+    metrics = FakeMetricsApi()
+    metrics.items = [
+        pod_metrics("first-1-a", "first-1", "250m", "100Mi"),
+        pod_metrics("second-1-a", "second-1", "1", "1Gi"),
+        pod_metrics("unrelated", "other-1", "2", "2Gi"),
+    ]
+
+    collector = usage.UsageCollector(state, metrics)
+    collector.collect()
+
+    assert metrics.calls == [("metrics.k8s.io", "v1beta1", "test", "pods", "job-name")]
+    [run] = collector.usage("test", "first")
+    assert run["active"]
+    assert run["containers"]["test"]["cpuPeak"] == 0.25
+    assert run["containers"]["test"]["memoryPeak"] == 100 * 1024 * 1024
+
+
+def test_finished_runs_keep_peak_and_average(state):
+    job = objects.create_owned_job("first-1", "first")
+    state.apply("job", "ADDED", job)
+    metrics = FakeMetricsApi()
+    collector = usage.UsageCollector(state, metrics)
+    for cpu, memory in (("100m", "64Mi"), ("300m", "128Mi")):
+        metrics.items = [pod_metrics("first-1-a", "first-1", cpu, memory)]
+        collector.collect()
+
+    job.status.active = None
+    state.apply("job", "MODIFIED", job)
+    collector.collect()
+
+    [run] = collector.usage("test", "first")
+    assert not run["active"]
+    assert run["samples"] == 2
+    assert run["containers"]["test"] == {
+        "cpuPeak": 0.3,
+        "cpuAvg": 0.2,
+        "memoryPeak": 128 * 1024 * 1024,
+        "memoryAvg": 96 * 1024 * 1024,
+    }
+
+
+def test_history_is_bounded(state):
+    metrics = FakeMetricsApi()
+    collector = usage.UsageCollector(state, metrics, history=2)
+    for i in range(3):
+        job = objects.create_owned_job(f"first-{i}", "first")
+        state.apply("job", "ADDED", job)
+        metrics.items = [pod_metrics(f"first-{i}-a", f"first-{i}", "1", "1Mi")]
+        collector.collect()
+        state.apply("job", "DELETED", job)
+        collector.collect()
+
+    assert [run["job"] for run in collector.usage("test", "first")] == [
+        "first-2",
+        "first-1",
+    ]
+
+
+def test_missing_metrics_api_is_ignored(state):
+    class MissingMetricsApi:
+        def list_namespaced_custom_object(self, *args, **kwargs):
+            raise ApiException(status=404, reason="Not Found")
+
+    state.apply("job", "ADDED", objects.create_owned_job("first-1", "first"))
+    collector = usage.UsageCollector(state, MissingMetricsApi())
+    collector.collect()
+
+    assert collector.usage("test", "first") == []
+
+
+def test_one_process_collects_and_shares_samples(state, tmp_path):
+    path = str(tmp_path / "usage.json")
+    state.apply("job", "ADDED", objects.create_owned_job("first-1", "first"))
+    leader_metrics, follower_metrics = FakeMetricsApi(), FakeMetricsApi()
+    leader_metrics.items = [pod_metrics("first-1-a", "first-1", "1", "1Mi")]
+    leader = usage.UsageCollector(state, leader_metrics, path=path)
+    follower = usage.UsageCollector(state, follower_metrics, path=path)
+
+    leader._tick()
+    follower._tick()
+
+    assert len(leader_metrics.calls) == 1
+    assert follower_metrics.calls == []
+    assert follower.usage("test", "first") == leader.usage("test", "first")
+    assert follower.usage("test", "first")[0]["containers"]["test"]["cpuPeak"] == 1
+
+
+def test_next_collector_keeps_the_history(state, tmp_path):
+    path = str(tmp_path / "usage.json")
+    job = objects.create_owned_job("first-1", "first")
+    state.apply("job", "ADDED", job)
+    metrics = FakeMetricsApi()
+    metrics.items = [pod_metrics("first-1-a", "first-1", "1", "1Mi")]
+    leader = usage.UsageCollector(state, metrics, path=path)
+    follower = usage.UsageCollector(state, metrics, path=path)
+    leader._tick()
+    leader.stop()
+
+    state.apply("job", "DELETED", job)
+    follower._tick()
+
+    [run] = follower.usage("test", "first")
+    assert run["job"] == "first-1"
+    assert not run["active"]
+    assert run["samples"] == 1
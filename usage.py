@@ -0,0 +1,302 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+
+from collections import deque
+from datetime import datetime, timezone
+from kubernetes.client.rest import ApiException
+from kubernetes.utils import parse_quantity
+from typing import Callable, Dict, List, Tuple
+
+from cache import unthrottled
+
+log = logging.getLogger("app.usage")
+
+# Label the Job controller sets on its pods. The older `job-name` label can be
+# selected on by every supported Kubernetes version.
+JOB_NAME_LABELS = ("batch.kubernetes.io/job-name", "job-name")
+
+
+class _Run:
+    """Running totals of the CPU and memory samples of one Job, by container name"""
+
+    __slots__ = ("job", "start", "samples", "containers")
+
+    def __init__(self, job: str, start: float):
+        self.job = job
+        self.start = start
+        self.samples = 0
+        # container name -> [cpu peak, cpu total, memory peak, memory total, samples]
+        self.containers: Dict[str, list] = {}
+
+    def dump(self) -> list:
+        return [self.job, self.start, self.samples, self.containers]
+
+    @classmethod
+    def load(cls, values: list) -> "_Run":
+        job, start, samples, containers = values
+        run = cls(job, start)
+        run.samples = samples
+        run.containers = containers
+        return run
+
+    def add(self, container: str, cpu: float, memory: int):
+        totals = self.containers.setdefault(container, [0.0, 0.0, 0, 0, 0])
+        totals[0] = max(totals[0], cpu)
+        totals[1] += cpu
+        totals[2] = max(totals[2], memory)
+        totals[3] += memory
+        totals[4] += 1
+
+    def summary(self, active: bool) -> dict:
+        return {
+            "job": self.job,
+            "startTime": datetime.fromtimestamp(self.start, timezone.utc).isoformat(),
+            "active": active,
+            "samples": self.samples,
+            "containers": {
+                name: {
+                    "cpuPeak": round(cpu_peak, 4),
+                    "cpuAvg": round(cpu_total / count, 4),
+                    "memoryPeak": memory_peak,
+                    "memoryAvg": memory_total // count,
+                }
+                for name, (
+                    cpu_peak,
+                    cpu_total,
+                    memory_peak,
+                    memory_total,
+                    count,
+                ) in sorted(self.containers.items())
+            },
+        }
+
+
+def _job_name(pod_metrics: dict) -> str:
+    labels = pod_metrics["metadata"].get("labels") or {}
+    for label in JOB_NAME_LABELS:
+        if label in labels:
+            return labels[label]
+    return None
+
+
+class UsageCollector:
+    """Sample the CPU and memory usage of running jobs' pods from the metrics API
+
+    Every `interval` seconds, each namespace with an active job gets one LIST of pod
+    metrics, rather than one call per pod. Pods are matched to their Job by label and
+    to its CronJob through the `ClusterState` job summaries. Each Job's samples are
+    reduced to the peak and average usage of each container. Once the Job stops
+    running, this summary moves into a ring buffer holding the last `history` runs of
+    its CronJob.
+
+    Jobs shorter than `interval` may finish between samples and not be recorded.
+
+    With a `path`, only one of the processes sharing it (ie: gunicorn workers)
+    collects samples: the one holding a lock on `<path>.lock`. It writes every
+    sample to `path`, which the other processes read. If it exits, another process
+    takes over the lock and the history on its next interval.
+
+    Args:
+        state (ClusterState): The cache which tracks which jobs are running
+        custom_api (CustomObjectsApi): The client used to list `metrics.k8s.io` pod metrics
+        interval (float): Seconds between samples
+        history (int): Runs to keep per CronJob
+        throttle (function, optional): Called before each metrics LIST, to wait for the
+            rate limit, see `kron.throttle`
+        path (str, optional): A file to share samples with other processes through
+    """
+
+    def __init__(
+        self,
+        state: object,
+        custom_api: object,
+        interval: float = 30,
+        history: int = 50,
+        throttle: Callable = None,
+        path: str = None,
+    ):
+        self.state = state
+        self.custom = custom_api
+        self.throttle = throttle or unthrottled
+        self.path = path
+        # Open while this process holds the collection lock
+        self._lock_fd = None
+        # Modification time of the samples last read from `path`
+        self._loaded_mtime = None
+        self.interval = interval
+        self.history = history
+        self._lock = threading.Lock()
+        # (namespace, job name) -> (cronjob name, _Run) of jobs being sampled
+        self._runs: Dict[Tuple[str, str], Tuple[str, _Run]] = {}
+        # (namespace, cronjob name) -> deque of finished run summaries, oldest first
+        self._finished: Dict[Tuple[str, str], deque] = {}
+        self._stop = threading.Event()
+        self._last_error = None
+
+    def start(self):
+        thread = threading.Thread(target=self._run_forever, name="usage")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _run_forever(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._tick()
+            except Exception as e:
+                log.error(f"collecting usage failed: {e}")
+
+    def _tick(self):
+        """Collect and share a sample, if this process is the one collecting them"""
+        if not self.path:
+            self.collect()
+        elif self._elect():
+            self.collect()
+            self._save()
+
+    def _elect(self) -> bool:
+        """Take the collection lock unless another process holds it
+
+        Returns:
+            bool: Whether this process collects samples
+        """
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        # Carry on from the samples of the previous collector
+        self._load()
+        log.info(f"collecting usage into {self.path}")
+        return True
+
+    def _save(self):
+        with self._lock:
+            samples = {
+                "runs": [
+                    [namespace, job, cronjob, run.dump()]
+                    for (namespace, job), (cronjob, run) in self._runs.items()
+                ],
+                "finished": [
+                    [namespace, cronjob, list(runs)]
+                    for (namespace, cronjob), runs in self._finished.items()
+                ],
+            }
+        # Replace the file at once, so readers never see a partial write
+        temp_path = f"{self.path}.{os.getpid()}"
+        with open(temp_path, "w") as f:
+            json.dump(samples, f)
+        os.replace(temp_path, self.path)
+
+    def _load(self):
+        """Read the samples in `path`, unless they haven't changed since the last read"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._loaded_mtime:
+                return
+            with open(self.path) as f:
+                samples = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            log.error(f"reading {self.path}: {e}")
+            return
+
+        with self._lock:
+            self._runs = {
+                (namespace, job): (cronjob, _Run.load(run))
+                for namespace, job, cronjob, run in samples["runs"]
+            }
+            self._finished = {
+                (namespace, cronjob): deque(runs, maxlen=self.history)
+                for namespace, cronjob, runs in samples["finished"]
+            }
+            self._loaded_mtime = mtime
+
+    def _list_pod_metrics(self, namespace: str) -> List[dict]:
+        try:
+            self.throttle()
+            metrics = self.custom.list_namespaced_custom_object(
+                "metrics.k8s.io",
+                "v1beta1",
+                namespace,
+                "pods",
+                label_selector=JOB_NAME_LABELS[1],
+            )
+        except ApiException as e:
+            # Usually metrics-server not being installed, so only log it once
+            error = f"listing pod metrics: {e.status} {e.reason}"
+            if error != self._last_error:
+                log.warning(error)
+                self._last_error = error
+            return []
+        self._last_error = None
+        return metrics.get("items", [])
+
+    def collect(self):
+        """Take one sample of every active job, and retire runs of jobs which finished"""
+        active = {
+            (job["namespace"], job["name"]): job for job in self.state.active_jobs()
+        }
+        samples = []
+        for namespace in sorted({namespace for namespace, name in active}):
+            for pod_metrics in self._list_pod_metrics(namespace):
+                job = active.get((namespace, _job_name(pod_metrics)))
+                if job:
+                    samples.append((job, pod_metrics))
+
+        with self._lock:
+            sampled = set()
+            for job, pod_metrics in samples:
+                key = (job["namespace"], job["name"])
+                if key not in self._runs:
+                    self._runs[key] = (job["cronjob"], _Run(job["name"], job["start"]))
+                cronjob, run = self._runs[key]
+                if key not in sampled:
+                    run.samples += 1
+                    sampled.add(key)
+                for container in pod_metrics.get("containers", []):
+                    usage = container.get("usage", {})
+                    run.add(
+                        container["name"],
+                        float(parse_quantity(usage.get("cpu", "0"))),
+                        int(parse_quantity(usage.get("memory", "0"))),
+                    )
+
+            for key in [key for key in self._runs if key not in active]:
+                cronjob, run = self._runs.pop(key)
+                owner = (key[0], cronjob)
+                if owner not in self._finished:
+                    self._finished[owner] = deque(maxlen=self.history)
+                self._finished[owner].append(run.summary(active=False))
+
+    def usage(self, namespace: str, cronjob: str) -> List[dict]:
+        """Return the usage of a CronJob's recent runs, newest first
+
+        Returns:
+            List of dicts: The job name, start time, whether it is still running, the
+                number of samples and, by container name, the peak and average CPU
+                (in cores) and memory (in bytes)
+        """
+        if self.path and self._lock_fd is None:
+            self._load()
+        with self._lock:
+            runs = [
+                run.summary(active=True)
+                for (run_namespace, job), (owner, run) in self._runs.items()
+                if run_namespace == namespace and owner == cronjob
+            ]
+            runs.extend(self._finished.get((namespace, cronjob), ()))
+        return sorted(runs, key=lambda run: run["startTime"], reverse=True)